@@ -0,0 +1,333 @@
+"""Load test of the SSE stream: fan-out latency, delivery rate and server resources.
+
+Starts web.py with simulated sensors in a temporary directory, then opens an
+increasing number of concurrent /stream clients. For each step, it measures
+the latency from sample creation to receipt, the delivery rate and the
+server memory and CPU usage. The report is printed, and can be saved as JSON
+to be compared with another run (e.g. another --sampler mode).
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+SERVER_DIR = pathlib.Path(__file__).resolve().parent
+DATA_FILES = ("films.csv", "chart_letters.csv")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+SERVER_STOP_TIMEOUT_SECONDS = 10.0
+
+
+class ClientStats:
+    """What a client received during the measurement window."""
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.frames = 0
+        self.missed = 0
+        self.last_sequence: Optional[int] = None
+        self.is_measuring = False
+
+    def received(self, sequence: Optional[int], payload: Dict) -> None:
+        if sequence is not None:
+            if self.last_sequence is not None and sequence > self.last_sequence + 1:
+                if self.is_measuring:
+                    self.missed += sequence - self.last_sequence - 1
+            self.last_sequence = sequence
+        if not self.is_measuring:
+            return
+        self.frames += 1
+        created = datetime.fromisoformat(payload["time"]).timestamp()
+        self.latencies.append(time.time() - created)
+
+
+async def _client(port: int, stats: ClientStats) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        # HTTP/1.0: the response is not chunked, and ends when the connection closes
+        writer.write(
+            b"GET /stream HTTP/1.0\r\nHost: localhost\r\n"
+            b"Accept: text/event-stream\r\n\r\n"
+        )
+        await writer.drain()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # Response headers
+
+        sequence = None
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            line = line.rstrip(b"\r\n")
+            if line.startswith(b"id: "):
+                sequence = int(line[4:])
+            elif line.startswith(b"data: "):
+                stats.received(sequence, json.loads(line[6:]))
+                sequence = None
+    finally:
+        writer.close()
+
+
+def _process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    for task in pathlib.Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children = (task / "children").read_text().split()
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _resources(pid: int) -> Dict[str, float]:
+    """Return the RSS (bytes) and CPU time (seconds) of the server and its children."""
+    rss = 0
+    cpu = 0.0
+    for p in _process_tree(pid):
+        try:
+            rss += int(pathlib.Path(f"/proc/{p}/statm").read_text().split()[1])
+            fields = pathlib.Path(f"/proc/{p}/stat").read_text().rsplit(")", 1)[1]
+            utime, stime = fields.split()[11:13]
+            cpu += (int(utime) + int(stime)) / CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            continue  # The process exited in the meantime
+    return {"rss": rss * PAGE_SIZE, "cpu": cpu}
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(len(ordered) * percent / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+async def _run_step(
+    port: int, pid: int, client_count: int, warmup: float, duration: float
+) -> Dict:
+    clients = [ClientStats() for _ in range(client_count)]
+    tasks = [asyncio.create_task(_client(port, stats)) for stats in clients]
+    await asyncio.sleep(warmup)
+
+    for stats in clients:
+        stats.is_measuring = True
+    start_resources = _resources(pid)
+    start = time.monotonic()
+    await asyncio.sleep(duration)
+    elapsed = time.monotonic() - start
+    end_resources = _resources(pid)
+    for stats in clients:
+        stats.is_measuring = False
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = [latency for stats in clients for latency in stats.latencies]
+    frames = sum(stats.frames for stats in clients)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "clients": client_count,
+        "connected": sum(1 for stats in clients if stats.last_sequence is not None),
+        "frames": frames,
+        "rate_per_client": round(frames / elapsed / client_count, 3),
+        "missed": sum(stats.missed for stats in clients),
+        "latency_ms": {
+            "p50": ms(_percentile(latencies, 50)),
+            "p95": ms(_percentile(latencies, 95)),
+            "p99": ms(_percentile(latencies, 99)),
+            "max": ms(max(latencies) if latencies else None),
+            "mean": ms(statistics.fmean(latencies) if latencies else None),
+        },
+        "server_rss_mb": round(end_resources["rss"] / 2**20, 1),
+        "server_cpu_percent": round(
+            100 * (end_resources["cpu"] - start_resources["cpu"]) / elapsed, 1
+        ),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_server(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"The server did not start listening on port {port}")
+
+
+def _print_report(report: Dict, baseline: Optional[Dict]) -> None:
+    print(
+        f"Mode: {report['mode']}, {report['host']}, Python {report['python']}, "
+        f"{report['duration']}s per step"
+    )
+    previous = {s["clients"]: s for s in baseline["steps"]} if baseline else {}
+    print(
+        f"{'clients':>8}{'rate/s':>9}{'missed':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'max ms':>9}{'RSS MB':>9}{'CPU %':>8}"
+        + (f"{'base p95':>10}{'base CPU':>10}" if baseline else "")
+    )
+    for step in report["steps"]:
+        latency = step["latency_ms"]
+        line = (
+            f"{step['clients']:>8}{step['rate_per_client']:>9}{step['missed']:>8}"
+            f"{latency['p50']!s:>9}{latency['p95']!s:>9}{latency['max']!s:>9}"
+            f"{step['server_rss_mb']:>9}{step['server_cpu_percent']:>8}"
+        )
+        base = previous.get(step["clients"])
+        if base:
+            line += (
+                f"{base['latency_ms']['p95']!s:>10}{base['server_cpu_percent']!s:>10}"
+            )
+        print(line)
+
+
+def _wait_for_group(server: subprocess.Popen, timeout: float) -> bool:
+    """Wait until the server and its sampler process have exited."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        server.poll()  # Reap the server, or its group lives on as a zombie
+        try:
+            os.killpg(server.pid, 0)
+        except ProcessLookupError:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def _stop_server(server: subprocess.Popen) -> None:
+    """Stop the server and its sampler process, which are in their own group."""
+    os.killpg(server.pid, signal.SIGTERM)
+    if not _wait_for_group(server, SERVER_STOP_TIMEOUT_SECONDS):
+        try:
+            os.killpg(server.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        _wait_for_group(server, SERVER_STOP_TIMEOUT_SECONDS)
+    server.wait()
+
+
+def _remove_ring(name: str) -> None:
+    # In case the server could not release its shared memory
+    try:
+        ring = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    ring.close()
+    ring.unlink()
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="SSE load test of web.py")
+    parser.add_argument(
+        "--clients",
+        default="1,5,10,25,50",
+        help="Comma-separated numbers of concurrent clients, one step each",
+    )
+    parser.add_argument(
+        "--duration", default=20.0, type=float, help="Measurement seconds per step"
+    )
+    parser.add_argument(
+        "--warmup", default=3.0, type=float, help="Seconds before measuring a step"
+    )
+    parser.add_argument(
+        "--sampler",
+        default="thread",
+        choices=["thread", "process"],
+        help="Server mode, passed to web.py",
+    )
+    parser.add_argument("--output", help="Save the report to this JSON file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_arguments()
+    client_counts = [int(n) for n in args.clients.split(",")]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    port = _free_port()
+    ring_name = f"thermometer-load-test-{os.getpid()}"
+    with tempfile.TemporaryDirectory() as work_dir:
+        # web.py uses relative paths for its data, configuration and logs
+        for name in DATA_FILES:
+            shutil.copy(SERVER_DIR / name, work_dir)
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                str(SERVER_DIR / "web.py"),
+                "--stub-sensors",
+                "--port",
+                str(port),
+                "--sampler",
+                args.sampler,
+                # Not the ring of a thermometer service running on this machine
+                "--ring-name",
+                ring_name,
+            ],
+            cwd=work_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # So that the whole process tree can be stopped
+            start_new_session=True,
+        )
+        try:
+            _wait_for_server(port, timeout=30)
+            steps = []
+            for client_count in client_counts:
+                print(f"Running {client_count} clients...", file=sys.stderr)
+                steps.append(
+                    asyncio.run(
+                        _run_step(
+                            port, server.pid, client_count, args.warmup, args.duration
+                        )
+                    )
+                )
+        finally:
+            _stop_server(server)
+            _remove_ring(ring_name)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "mode": args.sampler,
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "duration": args.duration,
+        "steps": steps,
+    }
+    _print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
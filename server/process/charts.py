@@ -0,0 +1,197 @@
+"""Development charts indexed by film, developer and dilution.
+
+The index (developer_charts.csv) maps each film, developer and dilution to a
+curve. Curves are rows of tables in the chart_letters.csv format, and are
+shared by all the combinations using them. The index is read on first use,
+and curves are read from disk when needed and kept in a bounded cache, so
+memory doesn't grow with the number of combinations.
+"""
+import bisect
+import csv
+import logging
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from process.development import UserError, parse_duration, parse_temperatures_header
+
+log = logging.getLogger(__name__)
+
+# The charts of films.csv (chart letters), used when no developer is selected
+DEFAULT_DEVELOPER = ""
+CURVE_CACHE_SIZE = 256
+
+_DILUTION_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*\+\s*(\d+(?:[.,]\d+)?)\s*$")
+
+
+def parse_dilution(dilution: str) -> float:
+    """Return the parts of water per part of stock: "1+9" -> 9.0, "stock" -> 0.0."""
+    if dilution.strip().lower() in ("", "stock"):
+        return 0.0
+    result = _DILUTION_RE.match(dilution)
+    if not result:
+        raise ValueError(f"Unable to parse dilution: {dilution}")
+    stock, water = (float(g.replace(",", ".")) for g in result.groups())
+    return water / stock
+
+
+class _CurveTable:
+    """A CSV file of curves, one per row. Rows are read on demand."""
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.temperatures = array("d")
+        self.offsets: Dict[str, int] = {}
+
+        # Only keep the position of each row
+        with open(filename, "rb") as f:
+            header = f.readline()
+            self.temperatures = array(
+                "d", parse_temperatures_header(self._parse_row(header))
+            )
+            offset = len(header)
+            for line in f:
+                curve_id = line.split(b",", 1)[0].decode("utf-8").strip()
+                if curve_id:
+                    self.offsets[curve_id] = offset
+                offset += len(line)
+
+    @staticmethod
+    def _parse_row(line: bytes) -> List[str]:
+        return next(csv.reader([line.decode("utf-8")]))
+
+    def read(self, curve_id: str) -> array:
+        """Return the durations of a curve, in seconds."""
+        with open(self.filename, "rb") as f:
+            f.seek(self.offsets[curve_id])
+            row = self._parse_row(f.readline())
+        return array("f", (parse_duration(d).total_seconds() for d in row[1:]))
+
+
+def _interpolate(temperatures: array, durations: array, temperature: float) -> float:
+    if temperature < temperatures[0]:
+        raise UserError("Too cold")
+    if temperature > temperatures[-1]:
+        raise UserError("Too hot")
+    index = bisect.bisect_right(temperatures, temperature)
+    if index >= len(temperatures):
+        # Exactly at the maximum
+        return durations[-1]
+    t0, t1 = temperatures[index - 1], temperatures[index]
+    d0, d1 = durations[index - 1], durations[index]
+    return ((temperature - t0) * d1 + (t1 - temperature) * d0) / (t1 - t0)
+
+
+_Index = Dict[Tuple[str, str], List[Tuple[float, str, str]]]
+
+
+class ChartStore:
+    """Development times by film, developer, dilution and temperature."""
+
+    def __init__(self, index_csv_file: str, curve_csv_files: List[str]) -> None:
+        self.index_csv_file = index_csv_file
+        self.curve_csv_files = curve_csv_files
+        self._lock = threading.Lock()
+        # (film name, developer) -> [(dilution, label, curve id)], sorted by dilution
+        self._index: Optional[_Index] = None
+        self._tables: Dict[str, _CurveTable] = {}
+        self._curves: "OrderedDict[str, array]" = OrderedDict()
+
+    def _load(self) -> _Index:
+        with self._lock:
+            if self._index is not None:
+                return self._index
+
+            tables: Dict[str, _CurveTable] = {}
+            for filename in self.curve_csv_files:
+                table = _CurveTable(filename)
+                for curve_id in table.offsets:
+                    if curve_id in tables:
+                        raise ValueError(
+                            f"Chart {curve_id} of {filename} is already defined "
+                            f"in {tables[curve_id].filename}"
+                        )
+                    tables[curve_id] = table
+            self._tables = tables
+
+            index: _Index = {}
+            with open(self.index_csv_file, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    film_name = f"{row['Brand']} {row['Film Type']}"
+                    curve_id = row["Chart"]
+                    if curve_id not in self._tables:
+                        log.warning("Unknown chart %s for %s", curve_id, film_name)
+                        continue
+                    index.setdefault((film_name, row["Developer"]), []).append(
+                        (parse_dilution(row["Dilution"]), row["Dilution"], curve_id)
+                    )
+            for dilutions in index.values():
+                dilutions.sort()
+            self._index = index
+            return index
+
+    def _curve(self, curve_id: str) -> Tuple[array, array]:
+        with self._lock:
+            durations = self._curves.get(curve_id)
+            if durations is not None:
+                self._curves.move_to_end(curve_id)
+            table = self._tables[curve_id]
+        if durations is None:
+            durations = table.read(curve_id)
+            with self._lock:
+                self._curves[curve_id] = durations
+                if len(self._curves) > CURVE_CACHE_SIZE:
+                    self._curves.popitem(last=False)
+        return table.temperatures, durations
+
+    def developers(self, film_name: str) -> Dict[str, List[str]]:
+        """Return the developers with a chart for the film, and their dilutions."""
+        return {
+            developer: [label for _, label, _ in dilutions]
+            for (name, developer), dilutions in sorted(self._load().items())
+            if name == film_name
+        }
+
+    def check(self, film_name: str, developer: str, dilution: str) -> None:
+        """Raise UserError if the film has no chart for this developer and dilution.
+
+        Raises ValueError if the dilution can't be parsed.
+        """
+        value = parse_dilution(dilution)
+        dilutions = self._load().get((film_name, developer))
+        if not dilutions:
+            raise UserError(f"No chart for {film_name} in {developer}")
+        if value < dilutions[0][0] or value > dilutions[-1][0]:
+            raise UserError(f"No chart for {developer} {dilution}")
+
+    def evaluator(
+        self, film_name: str, developer: str, dilution: str
+    ) -> Callable[[float], timedelta]:
+        """Return the development time function of a film, developer and dilution.
+
+        Dilutions between two charted ones are interpolated linearly.
+        """
+        dilutions = self._load().get((film_name, developer))
+        value = parse_dilution(dilution)
+
+        def evaluate(temperature: float) -> timedelta:
+            if not dilutions:
+                raise UserError(f"No chart for {film_name} in {developer}")
+            if value < dilutions[0][0] or value > dilutions[-1][0]:
+                raise UserError(f"No chart for {developer} {dilution}")
+
+            index = bisect.bisect_left([d for d, _, _ in dilutions], value)
+            high_dilution, _, high_curve = dilutions[index]
+            high = _interpolate(*self._curve(high_curve), temperature)
+            if high_dilution == value:
+                return timedelta(seconds=high)
+
+            low_dilution, _, low_curve = dilutions[index - 1]
+            low = _interpolate(*self._curve(low_curve), temperature)
+            weight = (value - low_dilution) / (high_dilution - low_dilution)
+            return timedelta(seconds=low + (high - low) * weight)
+
+        return evaluate
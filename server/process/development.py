@@ -52,7 +52,8 @@ def _read_films(
             )
 
 
-def _parse_temperatures_header(header_row) -> List[float]:
+def parse_temperatures_header(header_row) -> List[float]:
+    """Return the temperatures of a chart header: Chart Letter,18°C,19°C..."""
     if header_row[0] != "Chart Letter":
         raise ValueError("Expected: Chart Letter")
 
@@ -67,7 +68,8 @@ def _parse_temperatures_header(header_row) -> List[float]:
     return [parse_temp(t) for t in header_row[1:]]
 
 
-def _parse_duration(d: str) -> timedelta:
+def parse_duration(d: str) -> timedelta:
+    """Return the duration of a chart cell, as mm:ss."""
     splitted = d.split(":")
     if len(splitted) != 2:
         raise ValueError(f"Unable to parse duration: {d}")
@@ -116,11 +118,11 @@ def _read_chart_letter(csv_filename: str) -> Dict[str, Callable[[float], timedel
         for row in reader:
             if first_line:
                 first_line = False
-                temperatures = _parse_temperatures_header(row)
+                temperatures = parse_temperatures_header(row)
                 continue
 
             chart_letter = row[0]
-            durations = [_parse_duration(d) for d in row[1:]]
+            durations = [parse_duration(d) for d in row[1:]]
             durations_map[chart_letter] = _evaluator(temperatures, durations)
 
     return durations_map
@@ -0,0 +1,119 @@
+"""Noise filters for the sensor readings."""
+import statistics
+from collections import deque
+from typing import Callable, Optional
+
+
+class Filter:
+    """Base filter, keeping the last `size` raw readings in a ring buffer."""
+
+    def __init__(self, size: int = 1) -> None:
+        self.samples: deque = deque(maxlen=max(size, 1))
+
+    def add(self, value: float) -> float:
+        """Add a raw reading and return the filtered value."""
+        self.samples.append(value)
+        return self._filtered(value)
+
+    def _filtered(self, value: float) -> float:
+        return value
+
+
+class MedianFilter(Filter):
+    """Median of the last `size` readings. Removes isolated spikes."""
+
+    def _filtered(self, value: float) -> float:
+        return statistics.median(self.samples)
+
+
+class EmaFilter(Filter):
+    """Exponential moving average: the higher alpha, the faster it follows changes."""
+
+    def __init__(self, size: int = 1, alpha: float = 0.3) -> None:
+        super().__init__(size)
+        self.alpha = alpha
+        self._value: Optional[float] = None
+
+    def _filtered(self, value: float) -> float:
+        if self._value is None:
+            self._value = value
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+
+class KalmanFilter(Filter):
+    """1-D Kalman filter, modeling the temperature as a slow random walk."""
+
+    def __init__(
+        self,
+        size: int = 1,
+        process_variance: float = 1e-4,
+        measurement_variance: float = 1e-2,
+    ) -> None:
+        super().__init__(size)
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self._value: Optional[float] = None
+        self._variance = 1.0
+
+    def _filtered(self, value: float) -> float:
+        if self._value is None:
+            self._value = value
+            self._variance = self.measurement_variance
+            return value
+
+        # Predict, then correct with the new reading
+        variance = self._variance + self.process_variance
+        gain = variance / (variance + self.measurement_variance)
+        self._value += gain * (value - self._value)
+        self._variance = (1.0 - gain) * variance
+        return self._value
+
+
+FILTERS = {
+    "none": Filter,
+    "median": MedianFilter,
+    "ema": EmaFilter,
+    "kalman": KalmanFilter,
+}
+
+
+def create_filter(kind: str, **params) -> Filter:
+    """Create a filter by name: none, median, ema or kalman."""
+    try:
+        filter_class = FILTERS[kind]
+    except KeyError as e:
+        raise ValueError(f"Unknown filter: {kind}") from e
+    return filter_class(**params)
+
+
+class FilteredSensor:
+    """A sensor handler reading `oversampling` raw values per call, through a filter."""
+
+    def __init__(
+        self,
+        handler: Callable[[], float],
+        noise_filter: Filter,
+        oversampling: int = 1,
+    ) -> None:
+        self.handler = handler
+        self.noise_filter = noise_filter
+        self.oversampling = max(oversampling, 1)
+        self.last_raw: Optional[float] = None
+
+    @property
+    def is_filtered(self) -> bool:
+        return type(self.noise_filter) is not Filter or self.oversampling > 1
+
+    def __call__(self) -> float:
+        value = None
+        raw_values = []
+        for _ in range(self.oversampling):
+            self.last_raw = self.handler()
+            raw_values.append(self.last_raw)
+            value = self.noise_filter.add(self.last_raw)
+        if type(self.noise_filter) is Filter:
+            # No filter: the oversampled readings are averaged
+            return statistics.fmean(raw_values)
+        return value
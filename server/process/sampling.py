@@ -0,0 +1,123 @@
+"""Adaptive sampling rate of the measurements."""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+FAST_INTERVAL_SECONDS = 1.0
+IDLE_INTERVAL_SECONDS = 10.0
+# How long a client keeps the fast rate after it last signaled its presence
+DEMAND_TIMEOUT_SECONDS = 30.0
+# How long the fast rate is kept after a film is selected (i.e. a development is likely)
+ACTIVITY_TIMEOUT_SECONDS = 30 * 60.0
+# Temperature changes faster than this keep the fast rate
+FAST_CHANGE_CELSIUS_PER_MINUTE = 0.2
+# The rate of change is the slope of the samples over this window
+CHANGE_WINDOW_SECONDS = 5 * 60.0
+# Smaller changes over the window are noise, e.g. the DS18B20 0.0625°C steps
+CHANGE_DEADBAND_CELSIUS = 0.25
+
+
+class AdaptiveSamplingPolicy:
+    """Sample slowly when idle, and fast when someone is watching, a development is
+    likely running, or the temperatures change quickly.
+
+    All the timestamps use time.monotonic().
+    """
+
+    def __init__(
+        self,
+        fast_interval: float = FAST_INTERVAL_SECONDS,
+        idle_interval: float = IDLE_INTERVAL_SECONDS,
+        demand_timeout: float = DEMAND_TIMEOUT_SECONDS,
+        activity_timeout: float = ACTIVITY_TIMEOUT_SECONDS,
+        fast_change_rate: float = FAST_CHANGE_CELSIUS_PER_MINUTE,
+        change_window: float = CHANGE_WINDOW_SECONDS,
+        change_deadband: float = CHANGE_DEADBAND_CELSIUS,
+    ) -> None:
+        self.fast_interval = fast_interval
+        self.idle_interval = idle_interval
+        self.demand_timeout = demand_timeout
+        self.activity_timeout = activity_timeout
+        self.fast_change_rate = fast_change_rate
+        self.change_window = change_window
+        self.change_deadband = change_deadband
+
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._fast_until = 0.0
+        # Recent (time, temperature) by channel
+        self._history: Dict[str, Deque[Tuple[float, float]]] = {}
+
+    def _keep_fast(self, duration: float) -> bool:
+        """Return True if the rate was not fast yet."""
+        with self._lock:
+            now = time.monotonic()
+            was_fast = now < self._fast_until
+            self._fast_until = max(self._fast_until, now + duration)
+            return not was_fast
+
+    def notify_demand(self) -> None:
+        """A client is watching the measurements. Switches to the fast rate immediately."""
+        if self._keep_fast(self.demand_timeout):
+            self._wake.set()
+
+    def notify_activity(self) -> None:
+        """A development is starting (e.g. a film was selected)."""
+        if self._keep_fast(self.activity_timeout):
+            self._wake.set()
+
+    def wake(self) -> None:
+        """Interrupt the current wait, e.g. when stopping."""
+        self._wake.set()
+
+    def update(self, temperatures: Dict[str, Optional[float]]) -> None:
+        """Take the new measurements into account to detect quick changes."""
+        now = time.monotonic()
+        is_changing = False
+        for name, value in temperatures.items():
+            if value is None:
+                continue
+            history = self._history.setdefault(name, deque())
+            history.append((now, value))
+            while now - history[0][0] > self.change_window:
+                history.popleft()
+            if not is_changing and self._is_changing(history):
+                is_changing = True
+        if is_changing:
+            self._keep_fast(self.demand_timeout)
+
+    def _is_changing(self, history: Deque[Tuple[float, float]]) -> bool:
+        if len(history) < 2:
+            return False
+        # Least squares slope, in °C per minute
+        count = len(history)
+        mean_t = sum(t for t, _ in history) / count
+        mean_v = sum(v for _, v in history) / count
+        variance = sum((t - mean_t) ** 2 for t, _ in history)
+        if variance == 0:
+            return False
+        slope = sum((t - mean_t) * (v - mean_v) for t, v in history) / variance * 60.0
+        minutes = (history[-1][0] - history[0][0]) / 60.0
+        return (
+            abs(slope) >= self.fast_change_rate
+            and abs(slope) * minutes > self.change_deadband
+        )
+
+    def interval(self, has_subscribers: bool = False) -> float:
+        """Return the time to wait until the next measurement."""
+        if has_subscribers:
+            return self.fast_interval
+        with self._lock:
+            if time.monotonic() < self._fast_until:
+                return self.fast_interval
+        return self.idle_interval
+
+    def wait(self, has_subscribers: bool = False) -> None:
+        """Wait until the next measurement.
+
+        Returns early when woken up, so that a switch to the fast rate takes effect
+        within one tick.
+        """
+        if self._wake.wait(self.interval(has_subscribers)):
+            self._wake.clear()
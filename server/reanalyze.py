@@ -0,0 +1,397 @@
+"""Offline re-analysis of the measurement logs.
+
+For each session log and each requested film, computes the development time
+the film would have needed at the recorded water temperature, and integrates
+the development progress over the session: how long it would actually have
+taken with the temperature changes. The logs are processed in parallel by a
+pool of processes, and read in chunks, so memory doesn't depend on their size.
+
+Run from the server directory, like web.py:
+
+    python reanalyze.py --since 2026-10-01 --film "Ilford HP5+" --film 017712
+"""
+import argparse
+import csv
+import dataclasses
+import itertools
+import os
+import pathlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from process import charts, development
+from utils import log_export
+
+MEASURE_LOG_DIR = "./measurements"
+OUTPUT_DIR = "./reanalysis"
+CHUNK_ROWS = 4096
+# Longer gaps between two samples are not integrated (e.g. the sampler was stopped)
+MAX_SAMPLE_GAP_SECONDS = 60.0
+
+SESSION_FIELDS = [
+    "session_id",
+    "film",
+    "start",
+    "end",
+    "samples",
+    "min_temperature",
+    "mean_temperature",
+    "max_temperature",
+    "out_of_chart",
+    "min_duration",
+    "mean_duration",
+    "max_duration",
+    "progress",
+    "developed_after",
+]
+FILM_FIELDS = [
+    "film",
+    "sessions",
+    "samples",
+    "out_of_chart",
+    "min_duration",
+    "mean_duration",
+    "max_duration",
+    "developed_sessions",
+]
+
+# Loaded once in each worker process, as the evaluators can't be pickled
+_films: List[development.FilmDetails] = []
+
+
+def _open_chart_store() -> charts.ChartStore:
+    return charts.ChartStore(
+        "./developer_charts.csv", ["./chart_letters.csv", "./developer_curves.csv"]
+    )
+
+
+def _init_worker(film_names: List[str], developer: str, dilution: str) -> None:
+    global _films
+    dev_time_db = development.DevelopmentTime("./films.csv", "./chart_letters.csv")
+    films = [dev_time_db.for_film(name) for name in film_names]
+    if developer != charts.DEFAULT_DEVELOPER:
+        chart_store = _open_chart_store()
+        films = [
+            dataclasses.replace(
+                f, evaluator=chart_store.evaluator(str(f), developer, dilution)
+            )
+            for f in films
+        ]
+    _films = films
+
+
+def _read_chunks(
+    path: pathlib.Path,
+    channel: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Iterator[List[Tuple[datetime, float]]]:
+    """Yield the (time, temperature) samples of a log, CHUNK_ROWS rows at a time."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if channel not in (reader.fieldnames or []):
+            return
+        while True:
+            rows = list(itertools.islice(reader, CHUNK_ROWS))
+            if not rows:
+                return
+            chunk = []
+            for row in rows:
+                value = row[channel]
+                if not value:
+                    # The sensor could not be read
+                    continue
+                measurement_time = datetime.fromisoformat(row["time"])
+                if (since and measurement_time < since) or (
+                    until and measurement_time >= until
+                ):
+                    continue
+                chunk.append((measurement_time, float(value)))
+            if chunk:
+                yield chunk
+
+
+class _FilmAnalysis:
+    """Development of one film during one session."""
+
+    def __init__(self, film: development.FilmDetails) -> None:
+        self.film = film
+        self.samples = 0
+        self.out_of_chart = 0
+        self.durations_sum = 0.0
+        self.min_duration: Optional[float] = None
+        self.max_duration: Optional[float] = None
+        self.progress = 0.0
+        self.developed_after: Optional[float] = None
+        # Development time at the previous sample, None if out of the chart
+        self.last_duration: Optional[float] = None
+
+    def add(self, elapsed: float, gap: Optional[float], temperature: float) -> None:
+        # The previous temperature applies until this sample
+        if gap is not None and gap <= MAX_SAMPLE_GAP_SECONDS and self.last_duration:
+            progress = self.progress + gap / self.last_duration
+            if self.developed_after is None and progress >= 1.0:
+                remaining = (1.0 - self.progress) * self.last_duration
+                self.developed_after = elapsed - gap + remaining
+            self.progress = progress
+
+        self.samples += 1
+        try:
+            duration = self.film.development_time(temperature).total_seconds()
+        except development.UserError:
+            self.out_of_chart += 1
+            self.last_duration = None
+            return
+        self.last_duration = duration
+        self.durations_sum += duration
+        if self.min_duration is None or duration < self.min_duration:
+            self.min_duration = duration
+        if self.max_duration is None or duration > self.max_duration:
+            self.max_duration = duration
+
+    def row(self) -> Dict[str, object]:
+        evaluated = self.samples - self.out_of_chart
+        return {
+            "film": str(self.film),
+            "out_of_chart": self.out_of_chart,
+            "min_duration": self.min_duration,
+            "mean_duration": self.durations_sum / evaluated if evaluated else None,
+            "max_duration": self.max_duration,
+            "progress": round(self.progress, 4),
+            "developed_after": self.developed_after,
+        }
+
+
+def _analyze_session(
+    session_id: str,
+    path: pathlib.Path,
+    channel: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> List[Dict[str, object]]:
+    """Return one summary row per film for a session log."""
+    analyses = [_FilmAnalysis(film) for film in _films]
+    start: Optional[datetime] = None
+    last_time: Optional[datetime] = None
+    samples = 0
+    temperatures_sum = 0.0
+    min_temperature = max_temperature = None
+
+    for chunk in _read_chunks(path, channel, since, until):
+        for measurement_time, temperature in chunk:
+            if start is None:
+                start = measurement_time
+            elapsed = (measurement_time - start).total_seconds()
+            gap = (
+                (measurement_time - last_time).total_seconds() if last_time else None
+            )
+            last_time = measurement_time
+
+            samples += 1
+            temperatures_sum += temperature
+            if min_temperature is None or temperature < min_temperature:
+                min_temperature = temperature
+            if max_temperature is None or temperature > max_temperature:
+                max_temperature = temperature
+
+            # All the films at once, so the log is read once
+            for analysis in analyses:
+                analysis.add(elapsed, gap, temperature)
+
+    if not samples:
+        return []
+    session = {
+        "session_id": session_id,
+        "start": start.isoformat(),
+        "end": last_time.isoformat(),
+        "samples": samples,
+        "min_temperature": min_temperature,
+        "mean_temperature": round(temperatures_sum / samples, 3),
+        "max_temperature": max_temperature,
+    }
+    return [{**session, **analysis.row()} for analysis in analyses]
+
+
+def _summarize_films(session_rows: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    films: Dict[str, Dict[str, object]] = {}
+    durations_sums: Dict[str, float] = {}
+    for row in session_rows:
+        name = row["film"]
+        film = films.setdefault(
+            name,
+            {
+                "film": name,
+                "sessions": 0,
+                "samples": 0,
+                "out_of_chart": 0,
+                "min_duration": None,
+                "mean_duration": None,
+                "max_duration": None,
+                "developed_sessions": 0,
+            },
+        )
+        film["sessions"] += 1
+        film["samples"] += row["samples"]
+        film["out_of_chart"] += row["out_of_chart"]
+        if row["developed_after"] is not None:
+            film["developed_sessions"] += 1
+        if row["mean_duration"] is None:
+            continue
+        evaluated = row["samples"] - row["out_of_chart"]
+        durations_sums[name] = (
+            durations_sums.get(name, 0.0) + row["mean_duration"] * evaluated
+        )
+        if film["min_duration"] is None or row["min_duration"] < film["min_duration"]:
+            film["min_duration"] = row["min_duration"]
+        if film["max_duration"] is None or row["max_duration"] > film["max_duration"]:
+            film["max_duration"] = row["max_duration"]
+
+    for name, film in films.items():
+        evaluated = film["samples"] - film["out_of_chart"]
+        if evaluated:
+            film["mean_duration"] = durations_sums[name] / evaluated
+    return sorted(films.values(), key=lambda f: f["film"])
+
+
+def _write_table(path: pathlib.Path, fields: List[str], rows) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _resolve_films(
+    dev_time_db: development.DevelopmentTime, films: List[str]
+) -> List[str]:
+    """Return the names of the films given by name or DX number."""
+    if not films:
+        return sorted(dev_time_db.by_name)
+    names = []
+    for film in films:
+        details = dev_time_db.by_name.get(film) or dev_time_db.for_dx_number(film)
+        if not details:
+            raise SystemExit(f"Unknown film: {film}")
+        names.append(str(details))
+    return names
+
+
+def _check_developer(
+    film_names: List[str], developer: str, dilution: str, all_films: bool
+) -> List[str]:
+    """Return the films charted for the developer and dilution.
+
+    Any film missing is an error, unless all the films were requested.
+    """
+    try:
+        charts.parse_dilution(dilution)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if developer == charts.DEFAULT_DEVELOPER:
+        return film_names
+
+    chart_store = _open_chart_store()
+    charted = []
+    for name in film_names:
+        try:
+            chart_store.check(name, developer, dilution)
+        except development.UserError as e:
+            if not all_films:
+                raise SystemExit(str(e))
+            continue
+        charted.append(name)
+    if not charted:
+        raise SystemExit(f"No film has a chart for {developer} {dilution}")
+    return charted
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        # The measurement logs are in UTC
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Re-analyze the measurement logs")
+    parser.add_argument(
+        "--film",
+        action="append",
+        default=[],
+        help="Film name or DX number, can be repeated (default: all the films)",
+    )
+    parser.add_argument(
+        "--developer",
+        default=charts.DEFAULT_DEVELOPER,
+        help="Developer of developer_charts.csv (default: the film chart letter)",
+    )
+    parser.add_argument("--dilution", default="", help="Dilution, e.g. 1+9")
+    parser.add_argument(
+        "--channel", default="water", help="Temperature used for the development"
+    )
+    parser.add_argument("--since", type=_parse_time, help="Only samples from this time")
+    parser.add_argument(
+        "--until", type=_parse_time, help="Only samples before this time"
+    )
+    parser.add_argument("--log-dir", default=MEASURE_LOG_DIR)
+    parser.add_argument(
+        "--output-dir", default=OUTPUT_DIR, help="Where the summary tables are written"
+    )
+    parser.add_argument(
+        "--workers", default=os.cpu_count(), type=int, help="Number of processes"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_arguments()
+    film_names = _resolve_films(
+        development.DevelopmentTime("./films.csv", "./chart_letters.csv"), args.film
+    )
+    # Before starting the workers, which would all fail
+    film_names = _check_developer(
+        film_names, args.developer, args.dilution, all_films=not args.film
+    )
+    files = log_export.snapshot_files(args.log_dir)
+    print(
+        f"Analyzing {len(files)} sessions for {len(film_names)} films...",
+        file=sys.stderr,
+    )
+
+    session_rows: List[Dict[str, object]] = []
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(film_names, args.developer, args.dilution),
+    ) as executor:
+        for rows in executor.map(
+            _analyze_session,
+            [f.session_id for f in files],
+            [f.path for f in files],
+            itertools.repeat(args.channel),
+            itertools.repeat(args.since),
+            itertools.repeat(args.until),
+        ):
+            session_rows.extend(rows)
+
+    output_dir = pathlib.Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    film_rows = _summarize_films(session_rows)
+    _write_table(output_dir / "sessions.csv", SESSION_FIELDS, session_rows)
+    _write_table(output_dir / "films.csv", FILM_FIELDS, film_rows)
+
+    print(f"{'film':<32}{'sessions':>10}{'mean':>10}{'developed':>11}")
+    for film in film_rows:
+        mean = film["mean_duration"]
+        print(
+            f"{film['film']:<32}{film['sessions']:>10}"
+            f"{'-' if mean is None else round(mean):>10}"
+            f"{film['developed_sessions']:>11}"
+        )
+    print(f"Summary tables written to {output_dir}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
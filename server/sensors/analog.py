@@ -1,44 +1,108 @@
 """Analog temperature sensors using an Analog-Digital Converter (ADC)."""
 import math
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Optional
 
 import busio
 from adafruit_ads1x15 import ads1015, ads1115
+from adafruit_ads1x15.ads1x15 import Mode
 from adafruit_ads1x15.analog_in import AnalogIn
 
+from sensors.i2c import bus_lock
 
-def init_ads1015(i2c: busio.I2C):
+DEFAULT_BURST_SIZE = 32
+
+
+@dataclass(frozen=True)
+class Thermistor:
+    """A thermistor in a voltage divider, with its Steinhart-Hart coefficients."""
+
+    a: float = 0.001129148
+    b: float = 0.000234125
+    c: float = 0.0000000876741
+    series_resistor: float = 10000.0
+    supply_voltage: float = 3.3
+
+    def temperature(self, voltage: float) -> float:
+        """Return the temperature in celsius for the voltage across the divider."""
+        raw_adc = voltage / self.supply_voltage
+        temp = math.log(self.series_resistor / (1.0 / raw_adc - 1.0))
+        temp = 1.0 / (self.a + (self.b + (self.c * temp * temp)) * temp)
+        return temp - 273.15  # Convert from Kelvin to Celsius
+
+
+def init_ads1015(
+    i2c: busio.I2C, continuous: bool = False, thermistor: Optional[Thermistor] = None
+):
     """Initialize an ADS1015 analog input."""
     # Create the ADC object using the I2C bus
-    ads = ads1015.ADS1015(i2c)
-    return _init_analog(ads, ads1015.P0)
+    with bus_lock(i2c):
+        ads = ads1015.ADS1015(i2c)
+    return _init_analog(ads, ads1015.P0, bus_lock(i2c), continuous, thermistor)
 
 
-def init_ads1115(i2c: busio.I2C):
+def init_ads1115(
+    i2c: busio.I2C, continuous: bool = False, thermistor: Optional[Thermistor] = None
+):
     """Initialize an ADS1115 analog input."""
     # Create the ADC object using the I2C bus
-    ads = ads1115.ADS1115(i2c)
-    return _init_analog(ads, ads1115.P0)
+    with bus_lock(i2c):
+        ads = ads1115.ADS1115(i2c)
+    return _init_analog(ads, ads1115.P0, bus_lock(i2c), continuous, thermistor)
+
+
+def _init_analog(
+    ads,
+    pin,
+    lock,
+    continuous: bool = False,
+    thermistor: Optional[Thermistor] = None,
+    burst_size: int = DEFAULT_BURST_SIZE,
+):
+    """Initialize an analog input.
+
+    In single-shot mode, each reading is one conversion at the slowest (most
+    precise) rate. In continuous mode, the ADC converts at its fastest rate and
+    each reading averages a burst of conversions.
+    """
+    thermistor = thermistor or Thermistor()
+    with lock:
+        ads.gain = 1  # +/- 4.096
+        if continuous:
+            rate = ads.rates[-1]
+            ads.mode = Mode.CONTINUOUS
+        else:
+            rate = ads.rates[0]  # Slowest rate = highest precision
+        ads.data_rate = rate
+        # Create single-ended input on channel 0
+        chan = AnalogIn(ads, pin)
+
+    if not continuous:
+
+        def handler():
+            with lock:
+                voltage = chan.voltage
+            return thermistor.temperature(voltage)
 
+        return handler
 
-def _init_analog(ads, pin):
-    """Initialize an analog input."""
-    rate = ads.rates[0]  # Slowest rate = highest precision
-    ads.data_rate = rate
-    ads.gain = 1  # +/- 4.096
-    # Create single-ended input on channel 0
-    chan = AnalogIn(ads, pin)
+    conversion_time = 1.0 / rate
 
-    def handler():
-        return measure_analog(chan.voltage)
+    def burst_handler():
+        voltages = []
+        with lock:
+            for _ in range(burst_size):
+                voltages.append(chan.voltage)
+                # Wait for the next conversion, otherwise we read the same one again
+                time.sleep(conversion_time)
+        return statistics.fmean(thermistor.temperature(v) for v in voltages)
 
-    return handler
+    return burst_handler
 
 
 # From https://stackoverflow.com/questions/44747996/arduino-temperature-sensor-counting-back
 def measure_analog(voltage: float) -> float:
     """Measure the temperature from a thermistor."""
-    raw_adc = voltage / 3.3
-    temp = math.log(10000.0 / (1.0 / raw_adc - 1.0))
-    temp = 1.0 / (0.001129148 + (0.000234125 + (0.0000000876741 * temp * temp)) * temp)
-    celsius = temp - 273.15  # Convert from Kelvin to Celsius
-    return celsius
+    return Thermistor().temperature(voltage)
@@ -0,0 +1,16 @@
+"""Shared access to the I2C buses."""
+import threading
+from typing import Dict
+
+_bus_locks: Dict[int, threading.RLock] = {}
+_bus_locks_guard = threading.Lock()
+
+
+def bus_lock(i2c) -> threading.RLock:
+    """Return the lock serializing the transactions of all the devices on a bus."""
+    with _bus_locks_guard:
+        lock = _bus_locks.get(id(i2c))
+        if lock is None:
+            lock = threading.RLock()
+            _bus_locks[id(i2c)] = lock
+        return lock
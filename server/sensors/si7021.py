@@ -1,23 +1,84 @@
 """SI7021 temperature and humidity sensor module."""
+import threading
+from typing import Dict, Optional, Set, Tuple
 
 import adafruit_si7021
 
+from sensors.i2c import bus_lock
 
-def init_si7021(i2c):
-    """Initialize the SI7021 temperature sensor."""
-    sensor = adafruit_si7021.SI7021(i2c)
+# Reads the temperature measured during the last humidity conversion
+_READ_PREVIOUS_TEMPERATURE = 0xE0
+_TEMPERATURE = 0
+_HUMIDITY = 1
 
-    def handler():
-        return sensor.temperature
+_devices: Dict[int, "Si7021"] = {}
+_devices_lock = threading.Lock()
 
-    return handler
 
+class Si7021:
+    """A SI7021 serving both temperature and humidity from a single conversion.
 
-def init_si7021_humidity(i2c):
-    """Initialize the SI7021 humidity sensor."""
-    sensor = adafruit_si7021.SI7021(i2c)
+    Each conversion is read at most once per channel: a tick reading both
+    channels converts once, whatever the time between the two reads, and a
+    channel read again (e.g. oversampling) gets a new conversion.
+    """
+
+    def __init__(self, i2c) -> None:
+        self._lock = bus_lock(i2c)
+        with self._lock:
+            self._sensor = adafruit_si7021.SI7021(i2c)
+        self._last_measure: Optional[Tuple[float, float]] = None
+        self._read_channels: Set[int] = set()
+
+    def measure(self) -> Tuple[float, float]:
+        """Return (temperature, relative humidity) from a new conversion."""
+        with self._lock:
+            # The humidity conversion also measures the temperature, which can
+            # be read back without another conversion
+            humidity = self._sensor.relative_humidity
+            temperature = self._read_previous_temperature()
+            self._last_measure = (temperature, humidity)
+            self._read_channels = set()
+            return temperature, humidity
+
+    def _read(self, channel: int) -> float:
+        with self._lock:
+            if self._last_measure is None or channel in self._read_channels:
+                self.measure()
+            self._read_channels.add(channel)
+            return self._last_measure[channel]
+
+    def _read_previous_temperature(self) -> float:
+        data = bytearray(2)
+        with self._sensor.i2c_device as i2c:
+            i2c.write_then_readinto(bytes([_READ_PREVIOUS_TEMPERATURE]), data)
+        value = (data[0] << 8) | data[1]
+        return value * 175.72 / 65536.0 - 46.85
+
+    def temperature(self) -> float:
+        """Return the temperature in celsius."""
+        return self._read(_TEMPERATURE)
 
-    def handler():
-        return sensor.relative_humidity
+    def relative_humidity(self) -> float:
+        """Return the relative humidity in percent."""
+        return self._read(_HUMIDITY)
 
-    return handler
+
+def init_si7021_device(i2c) -> Si7021:
+    """Return the SI7021 of the I2C bus, shared by the temperature and humidity handlers."""
+    with _devices_lock:
+        device = _devices.get(id(i2c))
+        if device is None:
+            device = Si7021(i2c)
+            _devices[id(i2c)] = device
+        return device
+
+
+def init_si7021(i2c):
+    """Initialize the SI7021 temperature sensor."""
+    return init_si7021_device(i2c).temperature
+
+
+def init_si7021_humidity(i2c):
+    """Initialize the SI7021 humidity sensor."""
+    return init_si7021_device(i2c).relative_humidity
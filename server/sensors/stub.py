@@ -0,0 +1,15 @@
+"""Simulated sensors, to run the webapp without hardware (tests, load tests)."""
+import math
+import random
+import time
+
+
+def init_stub(base: float, amplitude: float = 0.5, period_seconds: float = 600.0):
+    """Initialize a simulated sensor: a slow sine wave with some noise."""
+    start = time.monotonic()
+
+    def handler():
+        phase = 2 * math.pi * (time.monotonic() - start) / period_seconds
+        return base + amplitude * math.sin(phase) + random.gauss(0.0, 0.02)
+
+    return handler
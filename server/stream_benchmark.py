@@ -0,0 +1,66 @@
+"""Compare the size and encoding cost of the JSON SSE stream and the binary stream."""
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from utils import binary_stream
+
+
+def _payloads(count: int):
+    start = datetime.now(timezone.utc)
+    for i in range(count):
+        payload = {
+            "time": (start + timedelta(seconds=i)).isoformat(),
+            "temperatures": [
+                {"id": "air", "temperature": 21.0 + random.random()},
+                {"id": "water", "temperature": 20.0 + random.random()},
+            ],
+            "humidity": {"id": "air", "humidity": 45.0 + random.random()},
+            "development": {
+                "duration": 420.0 + random.random() * 10,
+                "film": {
+                    "brand": "Kodak",
+                    "film_type": "Tri-X 400",
+                    "dx_number": "017534",
+                },
+            },
+        }
+        yield i + 1, payload
+
+
+def _sse_json(events):
+    return [
+        f"id: {sequence}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+        for sequence, payload in events
+    ]
+
+
+def _binary(events):
+    encoder = binary_stream.Encoder()
+    return [encoder.encode(sequence, payload) for sequence, payload in events]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", default=3600, type=int, help="Samples to encode")
+    parser.add_argument("--repeat", default=5, type=int, help="Timing repetitions")
+    args = parser.parse_args()
+
+    events = list(_payloads(args.samples))
+    for name, encode in (("SSE JSON", _sse_json), ("binary", _binary)):
+        frames = encode(events)
+        size = sum(len(f) for f in frames)
+        seconds = min(
+            timeit.repeat(lambda: encode(events), number=1, repeat=args.repeat)
+        )
+        print(
+            f"{name:>8}: {size / len(events):7.1f} bytes/sample, "
+            f"{size / 1024:9.1f} KiB total, "
+            f"{seconds / len(events) * 1e6:6.1f} µs/sample to encode"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -45,10 +45,15 @@ def main():
 
     # Initialize the temperature sensors
     temperature_sensors = OrderedDict()
+    thermistor = analog.Thermistor(*args.thermistor_coefficients)
     if args.ads1015:
-        temperature_sensors["ADS1015"] = analog.init_ads1015(i2c)
+        temperature_sensors["ADS1015"] = analog.init_ads1015(
+            i2c, continuous=args.ads_continuous, thermistor=thermistor
+        )
     if args.ads1115:
-        temperature_sensors["ADS1115"] = analog.init_ads1115(i2c)
+        temperature_sensors["ADS1115"] = analog.init_ads1115(
+            i2c, continuous=args.ads_continuous, thermistor=thermistor
+        )
     if args.si7021:
         temperature_sensors["Si7021"] = si7021.init_si7021(i2c)
     if args.ds18b20:
@@ -163,10 +168,24 @@ def init_barcode_scanner():
 
 def _parse_arguments() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Thermometer")
+    default_thermistor = analog.Thermistor()
 
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose mode")
     parser.add_argument("--ads1115", action="store_true", help="VMA320 on ADS1115")
     parser.add_argument("--ads1015", action="store_true", help="VMA320 on ADS1015")
+    parser.add_argument(
+        "--ads-continuous",
+        action="store_true",
+        help="Continuous ADC conversions, averaging a burst per measurement",
+    )
+    parser.add_argument(
+        "--thermistor-coefficients",
+        nargs=3,
+        type=float,
+        metavar=("A", "B", "C"),
+        default=(default_thermistor.a, default_thermistor.b, default_thermistor.c),
+        help="Steinhart-Hart coefficients of the thermistor",
+    )
     parser.add_argument("--si7021", action="store_true", help="Si7021")
     parser.add_argument("--ds18b20", action="store_true", help="DS18B20")
     parser.add_argument("--barcode", action="store_true", help="Enable barcode scanner")
@@ -1,14 +1,30 @@
+import collections
+import json
+import os
+import pathlib
 import queue
+import stat
+import tempfile
 import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
 
 class AtomicThreadLocalQueuesList:
-    """A thread-safe list of thread-local queues."""
+    """A thread-safe list of thread-local queues.
 
-    def __init__(self):
+    Broadcast payloads are numbered, and the last replay_size of them are kept
+    so that a subscriber can catch up with what it missed.
+    """
+
+    def __init__(self, replay_size: int = 0):
         self._list = []
         self._thread_local_queue = threading.local()
         self._lock = threading.Lock()
+        self._history: collections.deque = collections.deque(maxlen=replay_size)
+        self._sequence = 0
+        # id(queue) -> (thread name, subscription time), for diagnostics
+        self._subscriptions: Dict[int, Tuple[str, float]] = {}
 
     def __enter__(self):
         return self.acquire()
@@ -16,26 +32,69 @@ class AtomicThreadLocalQueuesList:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.release()
 
-    def acquire(self) -> queue.SimpleQueue:
+    def acquire(self, last_sequence: Optional[int] = None) -> queue.SimpleQueue:
+        """Subscribe to the broadcasts, as (sequence, payload) tuples.
+
+        If last_sequence is given, the queue starts with the payloads broadcast
+        after it that are still in the replay window.
+        """
         new_queue: queue.SimpleQueue = queue.SimpleQueue()
         self._thread_local_queue.queue = new_queue
         with self._lock:
+            if last_sequence is not None:
+                if last_sequence > self._sequence:
+                    # Numbering restarted (e.g. server restart): replay everything
+                    last_sequence = 0
+                for event in self._history:
+                    if event[0] > last_sequence:
+                        new_queue.put(event)
             self._list.append(new_queue)
+            self._subscriptions[id(new_queue)] = (
+                threading.current_thread().name,
+                time.time(),
+            )
         return new_queue
 
     def release(self):
         with self._lock:
             self._list.remove(self._thread_local_queue.queue)
+            self._subscriptions.pop(id(self._thread_local_queue.queue), None)
         del self._thread_local_queue.queue
 
+    def stats(self) -> List[Dict]:
+        """Return the thread, age and number of pending payloads of each subscriber."""
+        now = time.time()
+        with self._lock:
+            result = []
+            for q in self._list:
+                thread_name, subscribed = self._subscriptions.get(id(q), ("?", now))
+                result.append(
+                    {
+                        "thread": thread_name,
+                        "age_seconds": round(now - subscribed, 1),
+                        "depth": q.qsize(),
+                    }
+                )
+            return result
+
     def is_empty(self) -> bool:
         with self._lock:
             return len(self._list) == 0
 
-    def broadcast(self, payload):
+    def broadcast(self, payload, sequence: Optional[int] = None) -> int:
+        """Send the payload to all subscribers and return its sequence number.
+
+        The sequence is incremented automatically, unless given by the caller.
+        """
         with self._lock:
+            if sequence is None:
+                sequence = self._sequence + 1
+            self._sequence = sequence
+            event = (sequence, payload)
+            self._history.append(event)
             for q in self._list:
-                q.put(payload)
+                q.put(event)
+        return sequence
 
 
 class AtomicRef:
@@ -50,3 +109,27 @@ class AtomicRef:
     def set(self, value):
         with self._lock:
             self._value = value
+
+
+def atomic_write_json(path, data) -> None:
+    """Write a JSON file so that readers never see a partially written file."""
+    path = pathlib.Path(path)
+    # A unique temporary file, so that concurrent writers don't mix their content
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=path.name + ".", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            # mkstemp creates the file readable by its owner only
+            try:
+                mode = stat.S_IMODE(path.stat().st_mode)
+            except FileNotFoundError:
+                mode = 0o644
+            os.fchmod(f.fileno(), mode)
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
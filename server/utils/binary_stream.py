@@ -0,0 +1,142 @@
+"""Compact binary encoding of the measurement stream.
+
+Every frame starts with a 1-byte type and a 2-byte payload length
+(little-endian). There are two frame types:
+
+* METADATA: UTF-8 JSON with the channel names, the film and the development
+  error. It is sent first, then only when it changes.
+* SAMPLE: sequence (uint32), time (uint32 seconds + uint16 milliseconds since
+  the epoch), development duration (int32, tenths of seconds, -1 on error),
+  then one int16 per temperature channel (hundredths of °C) and the humidity
+  (uint16, hundredths of %). Missing values use the *_MISSING sentinels.
+"""
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+METADATA = ord("M")
+SAMPLE = ord("S")
+
+TEMPERATURE_MISSING = -(2**15)
+HUMIDITY_MISSING = 2**16 - 1
+DURATION_MISSING = -(2**31)
+
+_FRAME_HEADER = struct.Struct("<BH")
+_SAMPLE_HEADER = struct.Struct("<IIHi")
+_TEMPERATURE = struct.Struct("<h")
+_HUMIDITY = struct.Struct("<H")
+
+
+def _frame(frame_type: int, payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def _scaled(value: Optional[float], missing: int, low: int, high: int) -> int:
+    if value is None:
+        return missing
+    return min(max(round(value * 100), low), high)
+
+
+class Encoder:
+    """Encode the payloads of one client, remembering which metadata it already has."""
+
+    def __init__(self) -> None:
+        self._metadata: Optional[Dict] = None
+
+    def encode(self, sequence: int, payload: Dict) -> bytes:
+        """Return the frames for a payload: metadata if it changed, then the sample."""
+        temperatures = payload.get("temperatures", [])
+        development = payload.get("development")
+        metadata = {
+            "channels": [t["id"] for t in temperatures],
+            "film": development["film"] if development else None,
+            "error": development.get("error") if development else None,
+        }
+
+        frames = b""
+        if metadata != self._metadata:
+            self._metadata = metadata
+            frames += _frame(METADATA, json.dumps(metadata).encode("utf-8"))
+
+        measurement_time = datetime.fromisoformat(payload["time"]).timestamp()
+        seconds = int(measurement_time)
+        millis = int((measurement_time - seconds) * 1000)
+        if development is None:
+            duration = DURATION_MISSING
+        elif development["duration"] < 0:
+            duration = -1
+        else:
+            duration = round(development["duration"] * 10)
+
+        humidity = payload.get("humidity")
+        sample = _SAMPLE_HEADER.pack(sequence, seconds, millis, duration)
+        for t in temperatures:
+            sample += _TEMPERATURE.pack(
+                _scaled(
+                    t["temperature"], TEMPERATURE_MISSING, -(2**15) + 1, 2**15 - 1
+                )
+            )
+        sample += _HUMIDITY.pack(
+            _scaled(
+                humidity["humidity"] if humidity else None,
+                HUMIDITY_MISSING,
+                0,
+                2**16 - 2,
+            )
+        )
+        return frames + _frame(SAMPLE, sample)
+
+
+def decode(data: bytes) -> Iterator[Tuple[int, Dict]]:
+    """Decode a sequence of frames into (sequence, payload) tuples.
+
+    The payloads have the same shape as the JSON stream, minus the fields that
+    are not carried by the binary frames.
+    """
+    metadata: Dict = {"channels": [], "film": None, "error": None}
+    offset = 0
+    while offset < len(data):
+        frame_type, length = _FRAME_HEADER.unpack_from(data, offset)
+        offset += _FRAME_HEADER.size
+        body = data[offset : offset + length]
+        offset += length
+
+        if frame_type == METADATA:
+            metadata = json.loads(body.decode("utf-8"))
+            continue
+        if frame_type != SAMPLE:
+            continue  # Unknown frame types are skipped for forward compatibility
+
+        sequence, seconds, millis, duration = _SAMPLE_HEADER.unpack_from(body, 0)
+        position = _SAMPLE_HEADER.size
+        temperatures: List[Dict] = []
+        for channel in metadata["channels"]:
+            (value,) = _TEMPERATURE.unpack_from(body, position)
+            position += _TEMPERATURE.size
+            temperatures.append(
+                {
+                    "id": channel,
+                    "temperature": (
+                        None if value == TEMPERATURE_MISSING else value / 100
+                    ),
+                }
+            )
+        (humidity,) = _HUMIDITY.unpack_from(body, position)
+
+        payload: Dict = {
+            "time": datetime.fromtimestamp(
+                seconds + millis / 1000, timezone.utc
+            ).isoformat(),
+            "temperatures": temperatures,
+        }
+        if humidity != HUMIDITY_MISSING:
+            payload["humidity"] = {"id": "air", "humidity": humidity / 100}
+        if duration != DURATION_MISSING:
+            payload["development"] = {
+                "duration": duration / 10 if duration >= 0 else -1,
+                "film": metadata["film"],
+            }
+            if metadata["error"]:
+                payload["development"]["error"] = metadata["error"]
+        yield sequence, payload
@@ -0,0 +1,177 @@
+"""In-memory configuration, saved write-behind and reloaded when edited externally.
+
+Updates apply immediately in memory. They are written to disk after a short
+debounce, with an atomic rename, so a crash never leaves a partial file.
+External edits of the file are detected with filesystem notifications
+(watchdog), or by polling if watchdog is not installed.
+"""
+import json
+import logging
+import pathlib
+import threading
+import time
+from typing import Callable, Generic, List, Optional, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from utils.atomic import atomic_write_json
+
+log = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = 2.0
+POLL_INTERVAL_SECONDS = 2.0
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class ConfigStore(Generic[T]):
+    """Holds the current settings, loaded from a JSON file by the load function."""
+
+    def __init__(
+        self,
+        path: str,
+        load: Callable[[], T],
+        debounce: float = DEBOUNCE_SECONDS,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.debounce = debounce
+        self._load = load
+        self._condition = threading.Condition()
+        # Serializes our writes and the reads of external changes
+        self._file_lock = threading.Lock()
+        self._listeners: List[Callable[[T, T], None]] = []
+        self._save_at: Optional[float] = None
+        self._is_stopping = False
+        self._known_content = self._read_content()
+        self._settings = load()
+
+    def get(self) -> T:
+        """Return the current settings."""
+        with self._condition:
+            return self._settings
+
+    def update(self, **changes) -> T:
+        """Change some settings now, and save them to disk a bit later."""
+        with self._condition:
+            self._settings = self._settings.model_copy(update=changes)
+            self._save_at = time.monotonic() + self.debounce
+            self._condition.notify_all()
+            return self._settings
+
+    def add_listener(self, listener: Callable[[T, T], None]) -> None:
+        """Call listener(old, new) when the file is changed by someone else."""
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Start saving in the background and watching the file."""
+        threading.Thread(target=self._writer_thread, daemon=True).start()
+        try:
+            self._start_observer()
+        except ImportError:
+            log.info("watchdog is not installed, polling %s for changes", self.path)
+            threading.Thread(target=self._poll_thread, daemon=True).start()
+
+    def flush(self) -> None:
+        """Save the pending changes now."""
+        with self._condition:
+            if self._save_at is None:
+                return
+            self._save_at = None
+        self._write()
+
+    def stop(self) -> None:
+        """Save the pending changes and stop the background saving."""
+        self.flush()
+        with self._condition:
+            self._is_stopping = True
+            self._condition.notify_all()
+
+    def _read_content(self) -> Optional[str]:
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def _write(self) -> None:
+        with self._file_lock:
+            # The latest settings, even if another write was requested in between
+            with self._condition:
+                data = self._settings.model_dump()
+                previous_content = self._known_content
+                # atomic_write_json writes the same as json.dumps: used to ignore
+                # our own writes
+                self._known_content = json.dumps(data)
+            try:
+                atomic_write_json(self.path, data)
+            except OSError:
+                log.exception("Unable to save the configuration")
+                with self._condition:
+                    self._known_content = previous_content
+
+    def _writer_thread(self) -> None:
+        while True:
+            with self._condition:
+                while self._save_at is None and not self._is_stopping:
+                    self._condition.wait()
+                if self._is_stopping:
+                    return
+                delay = self._save_at - time.monotonic()
+                if delay > 0:
+                    # More updates may come in the meantime
+                    self._condition.wait(delay)
+                    continue
+                self._save_at = None
+            self._write()
+
+    def _start_observer(self) -> None:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        store = self
+        target = str(self.path.resolve())
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = [event.src_path, getattr(event, "dest_path", "")]
+                if any(p and str(pathlib.Path(p).resolve()) == target for p in paths):
+                    store.check_external_change()
+
+        observer = Observer()
+        observer.daemon = True
+        # Watch the directory: editors and atomic writes replace the file itself
+        observer.schedule(Handler(), str(self.path.resolve().parent))
+        observer.start()
+
+    def _poll_thread(self) -> None:
+        while not self._is_stopping:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            self.check_external_change()
+
+    def check_external_change(self) -> None:
+        """Reload the settings if the file differs from what we last read or wrote."""
+        # Not while we are writing, which would look like an external change
+        with self._file_lock:
+            content = self._read_content()
+            with self._condition:
+                if content is None or content == self._known_content:
+                    return
+                self._known_content = content
+
+            try:
+                new_settings = self._load()
+            except (ValidationError, ValueError) as e:
+                log.error("Invalid configuration in %s, ignored: %s", self.path, e)
+                return
+
+        with self._condition:
+            old_settings = self._settings
+            self._settings = new_settings
+            # The external edit wins over our pending changes
+            self._save_at = None
+        log.info("Configuration reloaded from %s", self.path)
+
+        for listener in self._listeners:
+            try:
+                listener(old_settings, new_settings)
+            except Exception:
+                log.exception("Unable to apply the new configuration")
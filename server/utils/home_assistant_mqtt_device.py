@@ -1,19 +1,26 @@
 """Home Assistant MQTT device for a thermometer"""
 
 import logging
+import threading
 import time
+from typing import Dict, Optional
 
+import paho.mqtt.client as mqtt
 from ha_mqtt_discoverable import DeviceInfo, Settings
 from ha_mqtt_discoverable.sensors import Sensor, SensorInfo
 
 log = logging.getLogger(__name__)
 
 DEFAULT_SEND_INTERVAL_SECONDS = 60
+MIN_RECONNECT_DELAY_SECONDS = 1
+MAX_RECONNECT_DELAY_SECONDS = 120
 
 
 class ThermometerDevice:
     """Home Assistant MQTT device for a thermometer
     This is self-discoverable and doesn't require manual configuration in Home Assistant.
+
+    All the sensors share a single MQTT connection, which reconnects automatically.
     """
 
     def __init__(
@@ -29,78 +36,106 @@ class ThermometerDevice:
         self.max_update_interval = max_update_interval
         self.last_reported = 0.0
 
-        # Configure the required parameters for the MQTT broker
-        mqtt_settings = Settings.MQTT(
-            host=mqtt_hostname, port=port, username=username, password=password
+        # One client for all the entities: the sensors don't open their own connection
+        # when they are given a client
+        self._client = mqtt.Client(client_id=device_id)
+        self._client.username_pw_set(username, password)
+        self._client.reconnect_delay_set(
+            MIN_RECONNECT_DELAY_SECONDS, MAX_RECONNECT_DELAY_SECONDS
+        )
+        self._client.on_connect = self._on_connect
+        self._mqtt_settings = Settings.MQTT(
+            host=mqtt_hostname,
+            port=port,
+            username=username,
+            password=password,
+            client=self._client,
         )
 
         # Define the device. At least one of `identifiers` or `connections` must be supplied
-        device_info = DeviceInfo(name=device_name, identifiers=device_id)
+        self._device_info = DeviceInfo(name=device_name, identifiers=device_id)
 
-        # Sensor 1: air temperature
-        # Associate the sensor with the device via the `device` parameter
-        # `unique_id` must also be set, otherwise Home Assistant will not display
-        # the device in the UI
-        air_temperature_sensor_info = SensorInfo(
-            name="Air temperature",
-            device_class="temperature",
-            unit_of_measurement="°C",
-            state_class="measurement",
-            unique_id="air_temperature_sensor",
-            device=device_info,
-        )
-        air_temperature_settings = Settings(
-            mqtt=mqtt_settings, entity=air_temperature_sensor_info
-        )
-        # Instantiate the sensor
-        self.air_temperature_sensor = Sensor(air_temperature_settings)
-
-        # Sensor 2: air humidity
-        air_humidity_sensor_info = SensorInfo(
-            name="Air humidity",
-            device_class="humidity",
-            unit_of_measurement="%",
-            state_class="measurement",
-            unique_id="air_humidity_sensor",
-            device=device_info,
+        self._sensors: Dict[str, Sensor] = {}
+        self._sensors_lock = threading.Lock()
+        self.register_sensor("air_temperature", "Air temperature", "temperature", "°C")
+        self.register_sensor("air_humidity", "Air humidity", "humidity", "%")
+        self.register_sensor(
+            "water_temperature", "Water temperature", "temperature", "°C"
         )
-        air_humidity_settings = Settings(
-            mqtt=mqtt_settings, entity=air_humidity_sensor_info
-        )
-        # Instantiate the sensor
-        self.air_humidity_sensor = Sensor(air_humidity_settings)
-
-        # Sensor 3: water temperature
-        water_temperature_sensor_info = SensorInfo(
-            name="Water temperature",
-            device_class="temperature",
-            unit_of_measurement="°C",
-            state_class="measurement",
-            unique_id="water_temperature_sensor",
-            device=device_info,
-        )
-        water_temperature_settings = Settings(
-            mqtt=mqtt_settings, entity=water_temperature_sensor_info
-        )
-        # Instantiate the sensor
-        self.water_temperature_sensor = Sensor(water_temperature_settings)
+
+        # Doesn't block or fail if the broker is unreachable: the network loop
+        # keeps retrying in the background
+        self._client.connect_async(mqtt_hostname, port)
+        self._client.loop_start()
 
     def __str__(self) -> str:
-        return "ThermometerDevice()"
+        return f"ThermometerDevice({', '.join(self._sensors)})"
 
-    def report_measures(
-        self, air_temperature: float, water_temperature: float, air_humidity: float
+    def register_sensor(
+        self, key: str, name: str, device_class: str, unit_of_measurement: str
     ) -> None:
-        """Report the sensor readings to Home Assistant."""
+        """Add a sensor to the device. Its state is reported under the given key."""
+        # `unique_id` must be set, otherwise Home Assistant will not display
+        # the device in the UI
+        sensor_info = SensorInfo(
+            name=name,
+            device_class=device_class,
+            unit_of_measurement=unit_of_measurement,
+            state_class="measurement",
+            unique_id=f"{key}_sensor",
+            device=self._device_info,
+        )
+        sensor = Sensor(Settings(mqtt=self._mqtt_settings, entity=sensor_info))
+        with self._sensors_lock:
+            self._sensors[key] = sensor
+        if self._client.is_connected():
+            self._write_config(key, sensor)
+
+    def _write_config(self, key: str, sensor: Sensor) -> None:
+        try:
+            # The discovery configuration is retained by the broker
+            sensor.write_config()
+        except Exception as e:
+            log.error("Failed to publish discovery of %s", key, exc_info=e)
+
+    def _on_connect(self, client, userdata, flags, rc) -> None:
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            log.warning(
+                "Unable to connect to the MQTT broker: %s", mqtt.connack_string(rc)
+            )
+            return
+        log.info("Connected to the MQTT broker")
+        with self._sensors_lock:
+            sensors = list(self._sensors.items())
+        for key, sensor in sensors:
+            self._write_config(key, sensor)
+
+    def report_measures(self, states: Dict[str, Optional[float]]) -> None:
+        """Report the sensor readings to Home Assistant, by sensor key.
+
+        Unknown keys and missing values are ignored.
+        """
         current_time = time.time()
         if (current_time - self.last_reported) < self.max_update_interval:
             return
         self.last_reported = current_time
 
+        if not self._client.is_connected():
+            log.debug("Not connected to the MQTT broker, skipping report")
+            return
+
+        with self._sensors_lock:
+            sensors = dict(self._sensors)
         try:
-            self.air_temperature_sensor.set_state(round(air_temperature, 2))
-            self.water_temperature_sensor.set_state(round(water_temperature, 2))
-            self.air_humidity_sensor.set_state(round(air_humidity, 2))
+            for key, value in states.items():
+                sensor = sensors.get(key)
+                if sensor is not None and value is not None:
+                    sensor.set_state(round(value, 2))
         except Exception as e:
             log.error("Failed to report measures", exc_info=e)
             return
+
+    def close(self) -> None:
+        """Disconnect from the MQTT broker."""
+        self._client.loop_stop()
+        self._client.disconnect()
@@ -0,0 +1,328 @@
+"""Streaming export of the measurement logs.
+
+The exports are generated chunk by chunk, so memory usage does not depend on
+the size of the logs. The content is fully determined by the snapshot of the
+files taken when the export starts: the logs are only appended to, so reading
+them up to their snapshot size gives the same bytes later. The snapshots are
+kept by the server, identified by the ETag, which allows resuming a download
+with a byte range even while the current session keeps growing.
+"""
+import csv
+import hashlib
+import heapq
+import io
+import pathlib
+import re
+import tarfile
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import (
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+CHUNK_SIZE = 64 * 1024
+LOG_FILE_PREFIX = "temperature_"
+LENGTH_CACHE_SIZE = 1024
+# Each snapshot takes 16 bytes per log
+SNAPSHOT_CACHE_SIZE = 64
+
+_SESSION_ID_RE = re.compile(r"^[\w-]+$")
+
+
+class ExportFile(NamedTuple):
+    """A measurement log, as it was when the export started."""
+
+    session_id: str
+    path: pathlib.Path
+    size: int
+    mtime_ns: int
+
+
+def snapshot_files(
+    log_dir: str, session_ids: Optional[List[str]] = None
+) -> List[ExportFile]:
+    """Return the logs of the given sessions (all sessions if None), oldest first."""
+    log_path = pathlib.Path(log_dir)
+    if session_ids is None:
+        paths = sorted(log_path.glob(f"{LOG_FILE_PREFIX}*.csv"))
+    else:
+        for session_id in session_ids:
+            if not _SESSION_ID_RE.match(session_id):
+                raise ValueError(f"Invalid session id: {session_id}")
+        paths = sorted(
+            log_path / f"{LOG_FILE_PREFIX}{session_id}.csv"
+            for session_id in session_ids
+        )
+
+    files = []
+    for path in paths:
+        stat = path.stat()  # Raises FileNotFoundError for unknown sessions
+        files.append(
+            ExportFile(
+                session_id=path.stem[len(LOG_FILE_PREFIX) :],
+                path=path,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+            )
+        )
+    return files
+
+
+class _LengthCache:
+    """Sizes of generated content, by key, least recently used first."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._lengths: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, chunks: Callable[[], Iterable[bytes]]) -> int:
+        with self._lock:
+            length = self._lengths.get(key)
+            if length is not None:
+                self._lengths.move_to_end(key)
+                return length
+        # Generated outside of the lock, at worst twice
+        length = sum(len(chunk) for chunk in chunks())
+        with self._lock:
+            self._lengths[key] = length
+            if len(self._lengths) > self._size:
+                self._lengths.popitem(last=False)
+        return length
+
+
+_lengths = _LengthCache(LENGTH_CACHE_SIZE)
+
+
+class _SnapshotCache:
+    """Sizes and times of the logs of the exports, by tag, least recently used first."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._snapshots: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, tag: str, files: List[ExportFile]) -> None:
+        snapshot = array("q")
+        for f in files:
+            snapshot.append(f.size)
+            snapshot.append(f.mtime_ns)
+        with self._lock:
+            self._snapshots[tag] = snapshot
+            self._snapshots.move_to_end(tag)
+            if len(self._snapshots) > self._size:
+                self._snapshots.popitem(last=False)
+
+    def get(self, tag: str) -> Optional[array]:
+        with self._lock:
+            snapshot = self._snapshots.get(tag)
+            if snapshot is not None:
+                self._snapshots.move_to_end(tag)
+            return snapshot
+
+
+_snapshots = _SnapshotCache(SNAPSHOT_CACHE_SIZE)
+
+
+def _snapshot_digest(files: List[ExportFile], params) -> str:
+    digest = hashlib.sha1()
+    for f in files:
+        digest.update(f"{f.path.name}:{f.size}:{f.mtime_ns // 1_000_000_000};".encode())
+    digest.update(repr(params).encode("utf-8"))
+    return digest.hexdigest()[:20]
+
+
+def etag(files: List[ExportFile], *params) -> str:
+    """Return a tag identifying an export, whatever the number of logs."""
+    return _snapshot_digest(files, params)
+
+
+def keep_snapshot(tag: str, files: List[ExportFile]) -> None:
+    """Keep the snapshot of the logs of an export, so that it can be resumed."""
+    _snapshots.put(tag, files)
+
+
+def is_known(tag: str) -> bool:
+    """Return True if the snapshot of the export with this tag is kept."""
+    return _snapshots.get(tag) is not None
+
+
+def restore_snapshot(
+    files: List[ExportFile], tag: str, *params
+) -> Optional[List[ExportFile]]:
+    """Return the files as they were when the tag was generated.
+
+    Returns None if the snapshot is unknown (e.g. the server was restarted, or
+    another worker generated it) or does not match the files and parameters,
+    e.g. if a log was added or removed since then.
+    """
+    snapshot = _snapshots.get(tag)
+    if snapshot is None or len(snapshot) != 2 * len(files):
+        return None
+
+    restored = []
+    for i, f in enumerate(files):
+        size, mtime_ns = snapshot[2 * i], snapshot[2 * i + 1]
+        if size > f.size:
+            return None
+        restored.append(f._replace(size=size, mtime_ns=mtime_ns))
+    if _snapshot_digest(restored, params) != tag:
+        return None
+    return restored
+
+
+def _read_blocks(f: ExportFile) -> Iterator[bytes]:
+    remaining = f.size
+    with open(f.path, "rb") as stream:
+        while remaining > 0:
+            block = stream.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                raise OSError(f"{f.path} was truncated during the export")
+            remaining -= len(block)
+            yield block
+
+
+def _read_lines(f: ExportFile) -> Iterator[str]:
+    remaining = f.size
+    with open(f.path, "rb") as stream:
+        for line in stream:
+            remaining -= len(line)
+            # Ignore what was written after the snapshot, including a partial line
+            if remaining < 0 or not line.endswith(b"\n"):
+                return
+            yield line.decode("utf-8")
+
+
+def _gzip_member(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    # wbits=31: gzip container, with a zero timestamp so the output is reproducible
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _tar_entry(f: ExportFile) -> Iterator[bytes]:
+    info = tarfile.TarInfo(name=f.path.name)
+    info.size = f.size
+    info.mtime = f.mtime_ns // 1_000_000_000
+    yield info.tobuf(format=tarfile.USTAR_FORMAT)
+    yield from _read_blocks(f)
+    yield tarfile.NUL * (-f.size % tarfile.BLOCKSIZE)
+
+
+def _archive_members(
+    files: List[ExportFile],
+) -> List[Tuple[Hashable, Callable[[], Iterator[bytes]]]]:
+    # Each log is compressed as a separate gzip member: the concatenation is a
+    # valid gzip stream, and the compressed size of a log can be reused
+    members = [
+        (
+            (str(f.path), f.size, f.mtime_ns),
+            lambda f=f: _gzip_member(_tar_entry(f)),
+        )
+        for f in files
+    ]
+    # End of archive marker
+    members.append(
+        ("end", lambda: _gzip_member([tarfile.NUL * (2 * tarfile.BLOCKSIZE)]))
+    )
+    return members
+
+
+def archive_length(files: List[ExportFile]) -> int:
+    """Return the size of the .tar.gz archive of the logs."""
+    return sum(_lengths.get(key, member) for key, member in _archive_members(files))
+
+
+def archive_chunks(
+    files: List[ExportFile], start: int = 0, stop: Optional[int] = None
+) -> Iterator[bytes]:
+    """Generate a .tar.gz archive of the logs, or the bytes from start to stop.
+
+    The logs ending before start are skipped without being compressed again,
+    when their compressed size is known.
+    """
+    position = 0
+    for key, member in _archive_members(files):
+        if stop is not None and position >= stop:
+            return
+        if start > position:
+            length = _lengths.get(key, member)
+            if position + length <= start:
+                position += length
+                continue
+        for chunk in member():
+            chunk_end = position + len(chunk)
+            if chunk_end > start:
+                end = len(chunk) if stop is None else stop - position
+                yield chunk[max(start - position, 0) : end]
+            position = chunk_end
+            if stop is not None and position >= stop:
+                return
+
+
+def merged_csv_chunks(
+    files: List[ExportFile],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Iterator[bytes]:
+    """Generate a single CSV with the rows of the logs between start and end.
+
+    The rows of all the logs are merged in time order.
+    """
+    channels = set()
+    for f in files:
+        header = next(csv.reader(_read_lines(f)), [])
+        channels.update(name for name in header if name != "time")
+    fieldnames = ["time", "session"] + sorted(channels)
+
+    def rows(f: ExportFile):
+        for row in csv.DictReader(_read_lines(f)):
+            measurement_time = datetime.fromisoformat(row["time"])
+            if start and measurement_time < start:
+                continue
+            if end and measurement_time >= end:
+                # Each log is in time order
+                return
+            row["session"] = f.session_id
+            yield measurement_time, row
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    for _, row in heapq.merge(*(rows(f) for f in files), key=lambda r: r[0]):
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def content_length(key: Hashable, chunks: Callable[[], Iterable[bytes]]) -> int:
+    """Return the size of an export, by generating and discarding it once per key."""
+    return _lengths.get(key, chunks)
+
+
+def slice_chunks(chunks: Iterable[bytes], start: int, stop: int) -> Iterator[bytes]:
+    """Keep only the bytes between start (included) and stop (excluded)."""
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(start - position, 0) : stop - position]
+        position = chunk_end
+        if position >= stop:
+            return
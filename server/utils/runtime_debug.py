@@ -0,0 +1,129 @@
+"""Runtime introspection: threads, garbage collector and memory allocations."""
+import gc
+import sys
+import threading
+import traceback
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+STACK_DEPTH = 8
+TOP_ALLOCATIONS = 20
+# One frame per allocation keeps tracemalloc overhead low enough for production
+TRACEMALLOC_FRAMES = 1
+
+
+def threads_report() -> List[Dict]:
+    """Return the live threads, with the innermost frames of their stack."""
+    frames = sys._current_frames()
+    report = []
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        stack = []
+        if frame:
+            # Innermost first. Source lines are not needed: don't load them
+            summary = traceback.StackSummary.extract(
+                traceback.walk_stack(frame), limit=STACK_DEPTH, lookup_lines=False
+            )
+            stack = [f"{f.filename}:{f.lineno} {f.name}" for f in reversed(summary)]
+        report.append(
+            {
+                "name": thread.name,
+                "ident": thread.ident,
+                "daemon": thread.daemon,
+                # The last frame is what the thread is running, or blocked on
+                "stack": stack,
+            }
+        )
+    return report
+
+
+def gc_report(count_objects: bool = False) -> Dict:
+    """Return the garbage collector statistics.
+
+    count_objects walks the whole heap to count the live generators by name,
+    which is slow on a big heap: only on demand.
+    """
+    report: Dict = {
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "generations": gc.get_stats(),
+        "garbage": len(gc.garbage),
+    }
+    if count_objects:
+        objects = gc.get_objects()
+        report["objects"] = len(objects)
+        report["generators"] = dict(
+            Counter(
+                o.__qualname__ for o in objects if type(o).__name__ == "generator"
+            ).most_common(TOP_ALLOCATIONS)
+        )
+    return report
+
+
+class TracemallocSession:
+    """On-demand allocation tracing, comparing snapshots to find what grows."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def stop(self) -> None:
+        with self._lock:
+            self._baseline = None
+        tracemalloc.stop()
+
+    def snapshot(self, limit: int = TOP_ALLOCATIONS) -> Dict:
+        """Return the top allocation sites, and keep the snapshot as baseline for diffs."""
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        snapshot = self._take_snapshot()
+        with self._lock:
+            self._baseline = snapshot
+        stats = snapshot.statistics("lineno")[:limit]
+        return {
+            "tracing": True,
+            "traced": tracemalloc.get_traced_memory(),
+            "top": [
+                {"site": str(s.traceback), "size": s.size, "count": s.count}
+                for s in stats
+            ],
+        }
+
+    def diff(self, limit: int = TOP_ALLOCATIONS) -> Dict:
+        """Return the allocation sites that grew the most since the last snapshot."""
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        snapshot = self._take_snapshot()
+        with self._lock:
+            baseline = self._baseline
+            self._baseline = snapshot
+        if baseline is None:
+            return {"tracing": True, "error": "No baseline snapshot, take one first"}
+        stats = snapshot.compare_to(baseline, "lineno")[:limit]
+        return {
+            "tracing": True,
+            "traced": tracemalloc.get_traced_memory(),
+            "top": [
+                {
+                    "site": str(s.traceback),
+                    "size": s.size,
+                    "size_diff": s.size_diff,
+                    "count_diff": s.count_diff,
+                }
+                for s in stats
+            ],
+        }
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
@@ -0,0 +1,55 @@
+"""Lightweight command channel from the web workers to the sampler process."""
+import logging
+import os
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = 5.0
+
+
+def listen(address: str) -> Listener:
+    """Open the command socket, unless another sampler is already serving it."""
+    if os.path.exists(address):
+        try:
+            with Client(address, family="AF_UNIX"):
+                pass
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Stale socket left behind by a previous sampler
+            os.remove(address)
+        else:
+            raise FileExistsError(f"A sampler is already listening on {address}")
+    return Listener(address, family="AF_UNIX")
+
+
+def serve_commands(
+    listener: Listener, handler: Callable[[Dict[str, Any]], Any]
+) -> None:
+    """Receive commands and reply with the handler's result.
+
+    Each connection carries a single command. This blocks forever, so run it
+    in a daemon thread.
+    """
+    with listener:
+        while True:
+            try:
+                with listener.accept() as conn:
+                    command = conn.recv()
+                    try:
+                        reply = handler(command)
+                    except Exception:
+                        log.exception("Unable to handle command: %s", command)
+                        reply = None
+                    conn.send(reply)
+            except (EOFError, OSError) as e:
+                log.warning("Control connection failed: %s", e)
+
+
+def send_command(address: str, command: Dict[str, Any]) -> Any:
+    """Send a command to the sampler process and return its reply."""
+    with Client(address, family="AF_UNIX") as conn:
+        conn.send(command)
+        if not conn.poll(DEFAULT_TIMEOUT_SECONDS):
+            raise TimeoutError(f"No reply from the sampler for {command}")
+        return conn.recv()
@@ -0,0 +1,267 @@
+"""Catalog of the measurement sessions.
+
+Each session is one CSV log file in the measurements directory. The catalog
+keeps its time span, film and per-channel statistics up to date as samples are
+logged, so that sessions can be listed without reading the raw logs again.
+"""
+import csv
+import json
+import logging
+import pathlib
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from utils.atomic import atomic_write_json
+
+log = logging.getLogger(__name__)
+
+CATALOG_FILE_NAME = "sessions.json"
+LOG_FILE_PATTERN = "temperature_*.csv"
+SAVE_INTERVAL_SECONDS = 10.0
+
+
+class ChannelSummary:
+    """Running minimum, maximum and mean of a measurement channel."""
+
+    def __init__(
+        self,
+        count: int = 0,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        total: float = 0.0,
+    ) -> None:
+        self.count = count
+        self.minimum = minimum
+        self.maximum = maximum
+        self.total = total
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def to_dict(self) -> Dict:
+        mean = self.total / self.count if self.count else None
+        return {
+            "count": self.count,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": mean,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ChannelSummary":
+        count = data.get("count", 0)
+        mean = data.get("mean")
+        total = mean * count if mean is not None else 0.0
+        return cls(count, data.get("min"), data.get("max"), total)
+
+
+def _session_id(log_file: pathlib.Path) -> str:
+    # temperature_2024-01-31_123456.csv -> 2024-01-31_123456
+    return log_file.stem.split("_", 1)[-1]
+
+
+class SessionCatalog:
+    """Sessions summaries, stored in a JSON file next to the measurement logs."""
+
+    def __init__(self, log_dir: str) -> None:
+        self.log_dir = pathlib.Path(log_dir)
+        self.catalog_file = self.log_dir / CATALOG_FILE_NAME
+        self._sessions: Dict[str, Dict] = {}
+        self._channels: Dict[str, Dict[str, ChannelSummary]] = {}
+        self._lock = threading.Lock()
+        self._loaded_mtime: Optional[float] = None
+        self._is_writer = False
+        self._is_dirty = False
+        self._last_saved = 0.0
+        # Sessions with samples not saved yet
+        self._modified: Set[str] = set()
+
+    def _load(self) -> None:
+        try:
+            mtime = self.catalog_file.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+
+        try:
+            with open(self.catalog_file, encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            log.exception("Unable to read the session catalog")
+            return
+
+        self._sessions = {}
+        self._channels = {}
+        for session in data.get("sessions", []):
+            channels = session.pop("channels", {})
+            self._sessions[session["id"]] = session
+            self._channels[session["id"]] = {
+                name: ChannelSummary.from_dict(summary)
+                for name, summary in channels.items()
+            }
+        self._loaded_mtime = mtime
+
+    def _refresh(self) -> None:
+        # The process writing the catalog always has the freshest data in memory
+        if not self._is_writer:
+            self._load()
+
+    def _to_dict(self, session_id: str) -> Dict:
+        return {
+            **self._sessions[session_id],
+            "channels": {
+                name: summary.to_dict()
+                for name, summary in self._channels[session_id].items()
+            },
+        }
+
+    def sessions(self) -> List[Dict]:
+        """Return the summaries of all sessions, oldest first."""
+        with self._lock:
+            self._refresh()
+            return [self._to_dict(session_id) for session_id in sorted(self._sessions)]
+
+    def session(self, session_id: str) -> Optional[Dict]:
+        """Return the summary of a session, or None if it is unknown."""
+        with self._lock:
+            self._refresh()
+            if session_id not in self._sessions:
+                return None
+            return self._to_dict(session_id)
+
+    def start_session(self, log_file: pathlib.Path, start_time: datetime) -> str:
+        """Register a new session logged to the given file, and return its id."""
+        session_id = _session_id(log_file)
+        with self._lock:
+            if not self._is_writer:
+                self._load()
+                self._is_writer = True
+            self._sessions[session_id] = {
+                "id": session_id,
+                "file": log_file.name,
+                "start": start_time.isoformat(),
+                "end": start_time.isoformat(),
+                "film": None,
+            }
+            self._channels[session_id] = {}
+            self._modified.add(session_id)
+            self._is_dirty = True
+        self.save(force=True)
+        return session_id
+
+    def add_sample(
+        self,
+        session_id: str,
+        measurement_time: datetime,
+        measurements: Dict[str, Optional[float]],
+        film: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Update the session summary with a new sample."""
+        with self._lock:
+            session = self._sessions[session_id]
+            session["end"] = measurement_time.isoformat()
+            if film is not None:
+                session["film"] = film
+            channels = self._channels[session_id]
+            for name, value in measurements.items():
+                if value is None:
+                    continue
+                if name not in channels:
+                    channels[name] = ChannelSummary()
+                channels[name].add(value)
+            self._modified.add(session_id)
+            self._is_dirty = True
+
+    def save(self, force: bool = False) -> None:
+        """Persist the catalog, at most every SAVE_INTERVAL_SECONDS unless forced."""
+        with self._lock:
+            if not self._is_dirty:
+                return
+            if not force and time.time() - self._last_saved < SAVE_INTERVAL_SECONDS:
+                return
+            # The size of the log summarized, to detect the samples logged after
+            # the last save, e.g. after a power loss
+            for session_id in self._modified:
+                session = self._sessions[session_id]
+                try:
+                    session["size"] = (self.log_dir / session["file"]).stat().st_size
+                except FileNotFoundError:
+                    session.pop("size", None)
+            self._modified.clear()
+            data = {
+                "sessions": [
+                    self._to_dict(session_id) for session_id in sorted(self._sessions)
+                ]
+            }
+            self._is_dirty = False
+            self._last_saved = time.time()
+
+        try:
+            atomic_write_json(self.catalog_file, data)
+        except OSError:
+            log.exception("Unable to save the session catalog")
+
+    def backfill(self) -> None:
+        """Summarize the logs that are not in the catalog, or changed since saved.
+
+        That includes older sessions, and the samples logged after the last
+        save of a session that was interrupted.
+        """
+        with self._lock:
+            self._load()
+            known_sizes = {
+                session["file"]: session.get("size")
+                for session in self._sessions.values()
+            }
+
+        for log_file in sorted(self.log_dir.glob(LOG_FILE_PATTERN)):
+            if known_sizes.get(log_file.name, -1) == log_file.stat().st_size:
+                continue
+            log.info("Adding %s to the session catalog", log_file.name)
+            try:
+                self._backfill_file(log_file)
+            except (OSError, ValueError, KeyError):
+                log.exception("Unable to summarize %s", log_file)
+        self.save(force=True)
+
+    def _backfill_file(self, log_file: pathlib.Path) -> None:
+        session_id = _session_id(log_file)
+        with self._lock:
+            # The film is not logged: keep the one already known
+            known = self._sessions.get(session_id, {})
+        session = {
+            "id": session_id,
+            "file": log_file.name,
+            "start": None,
+            "end": None,
+            "film": known.get("film"),
+            "size": log_file.stat().st_size,
+        }
+        channels: Dict[str, ChannelSummary] = {}
+
+        with open(log_file, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                measurement_time = datetime.fromisoformat(row.pop("time")).isoformat()
+                if session["start"] is None:
+                    session["start"] = measurement_time
+                session["end"] = measurement_time
+                for name, value in row.items():
+                    # Raw readings of the filtered channels are not summarized
+                    if not value or name.endswith("_raw"):
+                        continue
+                    if name not in channels:
+                        channels[name] = ChannelSummary()
+                    channels[name].add(float(value))
+
+        with self._lock:
+            self._sessions[session_id] = session
+            self._channels[session_id] = channels
+            self._is_dirty = True
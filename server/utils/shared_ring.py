@@ -0,0 +1,172 @@
+"""Single-writer, multi-reader ring buffer of samples in shared memory.
+
+The sampler process writes each sample into a fixed-size slot together with a
+monotonically increasing sequence number. Any number of reader processes can
+attach to the same segment and follow the sequence counter without involving
+the writer.
+"""
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, Optional, Tuple
+
+DEFAULT_SLOT_COUNT = 64
+DEFAULT_SLOT_SIZE = 2048
+STATUS_SIZE = 32
+
+# Last written sequence, slot count, slot size, writer pid,
+# status (e.g. the current DX number)
+_HEADER = struct.Struct(f"<QIII{STATUS_SIZE}s")
+_SEQUENCE = struct.Struct("<Q")
+_OWNER = struct.Struct("<I")
+_OWNER_OFFSET = 16
+# Slot sequence, payload length
+_SLOT_HEADER = struct.Struct("<QI")
+
+
+def _is_running(pid: int) -> bool:
+    if pid <= 0 or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, as another user
+        return True
+    return True
+
+
+class SharedRingBuffer:
+    """A ring buffer of byte records living in a named shared memory segment."""
+
+    def __init__(
+        self,
+        name: str,
+        create: bool = False,
+        slot_count: int = DEFAULT_SLOT_COUNT,
+        slot_size: int = DEFAULT_SLOT_SIZE,
+    ) -> None:
+        if create:
+            # The creator is the writer until another process claims the ring
+            size = _HEADER.size + slot_count * slot_size
+            try:
+                self._shm = shared_memory.SharedMemory(
+                    name=name, create=True, size=size
+                )
+            except FileExistsError:
+                existing = shared_memory.SharedMemory(name=name)
+                owner = _HEADER.unpack_from(existing.buf, 0)[3]
+                if _is_running(owner):
+                    # Not ours: must not be destroyed when we exit
+                    resource_tracker.unregister(existing._name, "shared_memory")
+                    existing.close()
+                    raise FileExistsError(
+                        f"Ring buffer {name} is in use by process {owner}"
+                    )
+                # Stale segment left behind by a sampler that was killed
+                existing.close()
+                existing.unlink()
+                self._shm = shared_memory.SharedMemory(
+                    name=name, create=True, size=size
+                )
+            _HEADER.pack_into(
+                self._shm.buf, 0, 0, slot_count, slot_size, os.getpid(), b""
+            )
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            # Readers must not destroy the segment when they exit
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+            _, slot_count, slot_size, _, _ = _HEADER.unpack_from(self._shm.buf, 0)
+
+        self.name = name
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+
+    def claim(self) -> None:
+        """Record the calling process as the writer, e.g. in a child process."""
+        _OWNER.pack_into(self._shm.buf, _OWNER_OFFSET, os.getpid())
+
+    def _slot_offset(self, sequence: int) -> int:
+        return _HEADER.size + (sequence % self.slot_count) * self.slot_size
+
+    def last_sequence(self) -> int:
+        """Return the sequence number of the last record written (0 if none)."""
+        return _SEQUENCE.unpack_from(self._shm.buf, 0)[0]
+
+    def write(self, data: bytes) -> int:
+        """Append a record and return its sequence number. Single writer only."""
+        if len(data) > self.slot_size - _SLOT_HEADER.size:
+            raise ValueError(f"Record too large for the ring buffer: {len(data)}")
+
+        buf = self._shm.buf
+        sequence = self.last_sequence() + 1
+        offset = self._slot_offset(sequence)
+        start = offset + _SLOT_HEADER.size
+
+        # Invalidate the slot while it is being rewritten, so that readers
+        # copying the previous record notice they have been lapped
+        _SLOT_HEADER.pack_into(buf, offset, 0, 0)
+        buf[start : start + len(data)] = data
+        _SLOT_HEADER.pack_into(buf, offset, sequence, len(data))
+        _SEQUENCE.pack_into(buf, 0, sequence)
+        return sequence
+
+    def read(self, sequence: int) -> Optional[bytes]:
+        """Return the record with the given sequence number.
+
+        Returns None if it has already been overwritten by the writer.
+        """
+        buf = self._shm.buf
+        offset = self._slot_offset(sequence)
+        slot_sequence, length = _SLOT_HEADER.unpack_from(buf, offset)
+        if slot_sequence != sequence:
+            return None
+
+        start = offset + _SLOT_HEADER.size
+        data = bytes(buf[start : start + length])
+
+        # The writer may have reused the slot while we were copying it
+        if _SLOT_HEADER.unpack_from(buf, offset)[0] != sequence:
+            return None
+        return data
+
+    def follow(self, is_stopping, poll_interval: float) -> Iterator[Tuple[int, bytes]]:
+        """Yield (sequence, record) for every new record until is_stopping is set."""
+        next_sequence = self.last_sequence() + 1
+        while not is_stopping.is_set():
+            last = self.last_sequence()
+            if last < next_sequence:
+                time.sleep(poll_interval)
+                continue
+
+            # Skip the records that were overwritten while we were away
+            next_sequence = max(next_sequence, last - self.slot_count + 1)
+            while next_sequence <= last:
+                data = self.read(next_sequence)
+                if data is not None:
+                    yield next_sequence, data
+                next_sequence += 1
+
+    def set_status(self, status: str) -> None:
+        """Publish a short status string (at most 32 bytes) to the readers."""
+        encoded = status.encode("utf-8")[:STATUS_SIZE]
+        offset = _HEADER.size - STATUS_SIZE
+        self._shm.buf[offset : offset + STATUS_SIZE] = encoded.ljust(
+            STATUS_SIZE, b"\0"
+        )
+
+    def status(self) -> str:
+        """Return the status string published by the writer."""
+        offset = _HEADER.size - STATUS_SIZE
+        raw = bytes(self._shm.buf[offset : offset + STATUS_SIZE])
+        return raw.rstrip(b"\0").decode("utf-8", errors="ignore")
+
+    def close(self) -> None:
+        """Detach from the shared memory segment."""
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Destroy the shared memory segment. Only the creator should call this."""
+        self._shm.unlink()
@@ -1,17 +1,21 @@
+import _thread
 import argparse
 import csv
+import dataclasses
+import hmac
 import json
 import logging
+import multiprocessing
+import os
 import time
 import threading
 import pathlib
+import signal
+import sys
 from datetime import datetime, timezone
-from typing import Dict, Optional, Tuple, Type
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional, Tuple, Type
 
-import board
-import busio
-
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic_settings import (
     BaseSettings,
     SettingsConfigDict,
@@ -19,30 +23,71 @@ from pydantic_settings import (
     JsonConfigSettingsSource,
 )
 from flask import Flask, request, abort, Response
+from werkzeug.serving import make_server
 
-from sensors import si7021, ds18b20
-from process import development
+from process import charts, development, filters, sampling
 from utils.atomic import AtomicThreadLocalQueuesList, AtomicRef
-from utils import home_assistant_http_sensor, home_assistant_mqtt_device
+from utils.config_store import ConfigStore
+from utils.session_catalog import SessionCatalog
+from utils.shared_ring import SharedRingBuffer
+from utils.startup_profile import StartupProfile, process_start
+from utils import binary_stream, log_export, runtime_debug
+from utils import sampler_control
+
+if TYPE_CHECKING:
+    # Heavy: only imported when Home Assistant is configured
+    from utils import home_assistant_http_sensor, home_assistant_mqtt_device
 
 CONFIGURATION_FILE = "./config.json"
 MEASURE_LOG_DIR = "./measurements"
 DEFAULT_DX_NUMBER = "017534"
 INTERVAL_BETWEEN_MEASUREMENTS_SECONDS = 1.0
+SHARED_RING_NAME = "thermometer-samples"
+SAMPLER_CONTROL_ADDRESS = "./sampler.sock"
+RING_POLL_INTERVAL_SECONDS = 0.05
+# How often the sampler process checks that the web server is still running
+PARENT_CHECK_INTERVAL_SECONDS = 1.0
+SAMPLER_STOP_TIMEOUT_SECONDS = 5.0
+# How often web workers remind the sampler process that they have clients
+DEMAND_REFRESH_SECONDS = 10.0
+# Number of samples kept for clients reconnecting to the stream
+REPLAY_WINDOW_SIZE = 120
+STARTUP_PROFILE_TIMEOUT_SECONDS = 120.0
+# Conversion time of the DS18B20 at its default 12 bits resolution
+DS18B20_READ_SECONDS = 0.75
+EXPORT_FORMATS = {
+    "tar.gz": ("application/gzip", "measurements.tar.gz"),
+    "csv": ("text/csv", "measurements.csv"),
+}
 
 log = logging.getLogger(__name__)
 app = Flask(__name__)
 
-subscribers = AtomicThreadLocalQueuesList()
+subscribers = AtomicThreadLocalQueuesList(replay_size=REPLAY_WINDOW_SIZE)
+session_catalog = SessionCatalog(MEASURE_LOG_DIR)
+sampling_policy = sampling.AdaptiveSamplingPolicy(
+    fast_interval=INTERVAL_BETWEEN_MEASUREMENTS_SECONDS
+)
+tracemalloc_session = runtime_debug.TracemallocSession()
 is_stopping = threading.Event()
+startup_profile = StartupProfile(process_start())
 
 dev_time_db: Optional[development.DevelopmentTime] = None
+chart_store: Optional[charts.ChartStore] = None
 film_details = AtomicRef()
+# (developer, dilution) used for the development time
+developer_selection = AtomicRef((charts.DEFAULT_DEVELOPER, ""))
 ha_temperature_service: Optional[
-    home_assistant_http_sensor.HomeAssistantHttpSensor
+    "home_assistant_http_sensor.HomeAssistantHttpSensor"
 ] = None
-ha_humidity_service: Optional[home_assistant_http_sensor.HomeAssistantHttpSensor] = None
-ha_device_service: Optional[home_assistant_mqtt_device.ThermometerDevice] = None
+ha_humidity_service: Optional[
+    "home_assistant_http_sensor.HomeAssistantHttpSensor"
+] = None
+ha_device_service: Optional["home_assistant_mqtt_device.ThermometerDevice"] = None
+config_store: Optional[ConfigStore] = None
+use_stub_sensors = False
+# Set when the sampler runs in a separate process, which then owns the film selection
+sampler_control_address: Optional[str] = None
 
 
 class HomeAssistantService(BaseModel):
@@ -52,6 +97,34 @@ class HomeAssistantService(BaseModel):
     token: str = ""
 
 
+class SensorFilter(BaseModel):
+    kind: Literal["none", "median", "ema", "kalman"] = "none"
+    # Size of the ring buffer of readings (the median window)
+    size: int = 5
+    # EMA smoothing factor
+    alpha: float = 0.3
+    # Kalman filter noise model
+    process_variance: float = 1e-4
+    measurement_variance: float = 1e-2
+    # Raw readings per published sample, each from a new conversion of the sensor
+    oversampling: int = Field(default=1, ge=1)
+
+
+class HomeAssistantMqttSensor(BaseModel):
+    # Measurement channel to report: the keys passed to report_measures
+    key: Literal[
+        "air",
+        "water",
+        "humidity",
+        "air_temperature",
+        "water_temperature",
+        "air_humidity",
+    ]
+    name: str
+    device_class: str = "temperature"
+    unit_of_measurement: str = "°C"
+
+
 class HomeAssistantMqttDevice(BaseModel):
     mqtt_hostname: str = "homeassistant.local"
     port: int = 1883
@@ -59,13 +132,22 @@ class HomeAssistantMqttDevice(BaseModel):
     password: str = ""
     device_name: str = "Pi Thermometre"
     device_id: str = "rpi_thermometre"
+    # Additional sensors, on top of the air temperature, air humidity and water temperature
+    sensors: List[HomeAssistantMqttSensor] = []
 
 
 class Settings(BaseSettings):
     dx_number: str = DEFAULT_DX_NUMBER
+    # Charts of developer_charts.csv, or the film's chart letter when empty
+    developer: str = charts.DEFAULT_DEVELOPER
+    dilution: str = ""
     home_assistant_temperature_service: HomeAssistantService = HomeAssistantService()
     home_assistant_humidity_service: HomeAssistantService = HomeAssistantService()
     home_assistant_mqtt_device: HomeAssistantMqttDevice = HomeAssistantMqttDevice()
+    # Noise filters by channel: air, water, humidity
+    filters: Dict[str, SensorFilter] = {}
+    # Bearer token for /debug/runtime, which is disabled when empty
+    debug_token: str = ""
 
     model_config = SettingsConfigDict(
         json_file=CONFIGURATION_FILE,
@@ -100,8 +182,7 @@ def dx_number_method():
             if dx_number:
                 new_film_details = dev_time_db.for_dx_number(dx_number)
                 if new_film_details:
-                    film_details.set(new_film_details)
-                    _save_last_dx_number(new_film_details.dx_number)
+                    _select_film(new_film_details)
                     return _return_dx_number()
                 abort(404)
         abort(403)
@@ -109,6 +190,100 @@ def dx_number_method():
         return _return_dx_number()
 
 
+def _select_film(new_film_details: development.FilmDetails) -> None:
+    if sampler_control_address:
+        # The sampler process persists the selection in the configuration file
+        try:
+            sampler_control.send_command(
+                sampler_control_address, {"dx_number": new_film_details.dx_number}
+            )
+        except (OSError, TimeoutError):
+            log.exception("Unable to reach the sampler process")
+            abort(503)
+    else:
+        _save_last_dx_number(new_film_details.dx_number)
+        sampling_policy.notify_activity()
+    film_details.set(new_film_details)
+
+
+@app.route("/developer", methods=["GET", "POST"])
+def developer_method():
+    """Get or set the developer and its dilution."""
+    if request.method == "POST":
+        content = request.json
+        if content and "developer" in content:
+            developer = content["developer"]
+            dilution = content.get("dilution", "")
+            try:
+                charts.parse_dilution(dilution)
+            except ValueError:
+                abort(400)
+            if developer != charts.DEFAULT_DEVELOPER:
+                # Must be charted for the current film
+                details = film_details.get()
+                if not details:
+                    abort(404)
+                try:
+                    chart_store.check(str(details), developer, dilution)
+                except development.UserError:
+                    abort(404)
+            _select_developer(developer, dilution)
+            return _return_developer()
+        abort(403)
+    else:  # GET
+        return _return_developer()
+
+
+def _select_developer(developer: str, dilution: str) -> None:
+    if sampler_control_address:
+        try:
+            sampler_control.send_command(
+                sampler_control_address,
+                {"developer": developer, "dilution": dilution},
+            )
+        except (OSError, TimeoutError):
+            log.exception("Unable to reach the sampler process")
+            abort(503)
+    else:
+        config_store.update(developer=developer, dilution=dilution)
+        sampling_policy.notify_activity()
+    developer_selection.set((developer, dilution))
+
+
+def _return_developer() -> Dict[str, object]:
+    developer, dilution = developer_selection.get()
+    details = film_details.get()
+    return {
+        "developer": developer,
+        "dilution": dilution,
+        # The charted developers and dilutions for the current film
+        "available": chart_store.developers(str(details)) if details else {},
+    }
+
+
+def _development_film(
+    details: development.FilmDetails,
+) -> development.FilmDetails:
+    """Return the film, developed with the selected developer."""
+    developer, dilution = developer_selection.get()
+    if developer == charts.DEFAULT_DEVELOPER:
+        return details
+    return dataclasses.replace(
+        details, evaluator=chart_store.evaluator(str(details), developer, dilution)
+    )
+
+
+def _notify_demand() -> None:
+    """Switch the sampler to the fast rate, as someone is watching."""
+    if not sampler_control_address:
+        sampling_policy.notify_demand()
+        return
+    try:
+        sampler_control.send_command(sampler_control_address, {"demand": True})
+    except (OSError, TimeoutError) as e:
+        log.debug("Unable to notify the sampler process: %s", e)
+
+
 def _return_dx_number() -> Dict[str, Optional[str]]:
     details = film_details.get()
     if not details:
@@ -118,28 +293,230 @@ def _return_dx_number() -> Dict[str, Optional[str]]:
     return {"dx_number": dx_number}
 
 
-def _event_stream():
-    log.info("Client connected")
+def _event_stream(last_event_id: Optional[int] = None):
+    log.info("Client connected (last event: %s)", last_event_id)
 
-    with subscribers as q:
-        try:
-            while not is_stopping.is_set():
-                # No newline in the json payload, otherwise the client will not receive it
-                json_payload = json.dumps(q.get())
-                yield f"data: {json_payload}\n\n"  # send data to client
-        except GeneratorExit:  # client disconnected
-            log.info("Client disconnected")
+    q = subscribers.acquire(last_event_id)
+    _notify_demand()
+    try:
+        while not is_stopping.is_set():
+            sequence, payload = q.get()
+            # No newline in the json payload, otherwise the client will not receive it
+            json_payload = json.dumps(payload)
+            yield f"id: {sequence}\ndata: {json_payload}\n\n"  # send data to client
+    except GeneratorExit:  # client disconnected
+        log.info("Client disconnected")
+    finally:
+        subscribers.release()
+
+
+def _binary_stream(last_event_id: Optional[int] = None):
+    log.info("Binary client connected (last event: %s)", last_event_id)
+
+    encoder = binary_stream.Encoder()
+    q = subscribers.acquire(last_event_id)
+    _notify_demand()
+    try:
+        while not is_stopping.is_set():
+            sequence, payload = q.get()
+            yield encoder.encode(sequence, payload)
+    except GeneratorExit:  # client disconnected
+        log.info("Binary client disconnected")
+    finally:
+        subscribers.release()
+
+
+def _last_event_id() -> Optional[int]:
+    # Sent by EventSource when reconnecting. The query parameter allows resuming
+    # from a new EventSource, which can't set headers.
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+@app.route("/sessions")
+def sessions_list():
+    """List the measurement sessions, with their summaries."""
+    return {"sessions": session_catalog.sessions()}
+
+
+@app.route("/sessions/<session_id>")
+def session_details(session_id: str):
+    """Get the summary of a measurement session."""
+    session = session_catalog.session(session_id)
+    if not session:
+        abort(404)
+    return session
+
+
+@app.route("/export")
+def export_measurements():
+    """Stream the measurement logs, as a .tar.gz archive or a single merged CSV.
+
+    Query parameters: format (tar.gz or csv), sessions (comma-separated ids,
+    all sessions by default), start and end (ISO 8601 times, csv only).
+    Single byte ranges are supported to resume interrupted downloads, with
+    If-Range set to the ETag of the first response, or without If-Range if
+    the logs haven't changed since. Otherwise, the whole export is sent.
+    """
+    export_format = request.args.get("format", "tar.gz")
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    mimetype, filename = EXPORT_FORMATS[export_format]
+
+    session_ids = request.args.get("sessions")
+    try:
+        start = _parse_time_argument("start")
+        end = _parse_time_argument("end")
+        files = log_export.snapshot_files(
+            MEASURE_LOG_DIR, session_ids.split(",") if session_ids else None
+        )
+    except ValueError:
+        abort(400)
+    except FileNotFoundError:
+        abort(404)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename={filename}",
+    }
+
+    # A range is only served for the snapshot of the logs taken by the download
+    # being resumed, identified by its ETag
+    params = (export_format, start, end)
+    if_range = request.headers.get("If-Range", "").strip('"')
+    resumed = None
+    if request.range and if_range:
+        tag = if_range
+        resumed = log_export.restore_snapshot(files, tag, *params)
+    else:
+        tag = log_export.etag(files, *params)
+        if request.range and log_export.is_known(tag):
+            # Without If-Range (e.g. curl -C -, wget -c): only if the logs
+            # haven't changed since an export was sent
+            resumed = files
+    if resumed is None:
+        tag = log_export.etag(files, *params)
+        log_export.keep_snapshot(tag, files)
+        headers["ETag"] = f'"{tag}"'
+        if export_format == "csv":
+            chunks = log_export.merged_csv_chunks(files, start, end)
+        else:
+            chunks = log_export.archive_chunks(files)
+        return Response(chunks, mimetype=mimetype, headers=headers)
+
+    headers["ETag"] = f'"{tag}"'
+    if export_format == "csv":
+        length = log_export.content_length(
+            tag, lambda: log_export.merged_csv_chunks(resumed, start, end)
+        )
+    else:
+        length = log_export.archive_length(resumed)
+
+    bounds = request.range.range_for_length(length)
+    if bounds is None:
+        return Response(status=416, headers={"Content-Range": f"bytes */{length}"})
+    first, stop = bounds
+    headers["Content-Range"] = f"bytes {first}-{stop - 1}/{length}"
+    headers["Content-Length"] = str(stop - first)
+    if export_format == "csv":
+        chunks = log_export.slice_chunks(
+            log_export.merged_csv_chunks(resumed, start, end), first, stop
+        )
+    else:
+        chunks = log_export.archive_chunks(resumed, first, stop)
+    return Response(chunks, status=206, mimetype=mimetype, headers=headers)
+
+
+def _parse_time_argument(name: str) -> Optional[datetime]:
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        # The measurement logs are in UTC
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+@app.route("/debug/runtime", methods=["GET", "POST"])
+def debug_runtime():
+    """Report the threads, stream subscribers, garbage collector and allocations.
+
+    Requires the debug_token of the configuration as a Bearer token, never in
+    the URL, which ends up in the access logs. Query parameters: objects=1
+    counts the live generators (walks the heap). With POST only,
+    tracemalloc=start|snapshot|diff|stop controls allocation tracing.
+    """
+    token = config_store.get().debug_token if config_store else ""
+    if not token:
+        abort(404)
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        abort(401)
+    provided = authorization[len("Bearer ") :]
+    if not hmac.compare_digest(provided.encode("utf-8"), token.encode("utf-8")):
+        abort(403)
+
+    report = {
+        "threads": runtime_debug.threads_report(),
+        "subscribers": subscribers.stats(),
+        "gc": runtime_debug.gc_report(request.args.get("objects") == "1"),
+    }
+
+    action = request.args.get("tracemalloc")
+    if action and request.method != "POST":
+        # Changes the tracing state
+        abort(405)
+    if action == "start":
+        tracemalloc_session.start()
+        report["tracemalloc"] = tracemalloc_session.snapshot()
+    elif action == "snapshot":
+        report["tracemalloc"] = tracemalloc_session.snapshot()
+    elif action == "diff":
+        report["tracemalloc"] = tracemalloc_session.diff()
+    elif action == "stop":
+        tracemalloc_session.stop()
+        report["tracemalloc"] = {"tracing": False}
+    elif action:
+        abort(400)
+    return report
 
 
 @app.route("/stream")
 def stream():
-    """Endpoint for the Server-Sent Events (SSE) stream of temperature measurements."""
-    response = Response(_event_stream(), mimetype="text/event-stream")
+    """Endpoint for the Server-Sent Events (SSE) stream of temperature measurements.
+
+    Each event has the sequence number of the sample as id: clients resuming with
+    Last-Event-ID receive the samples they missed, within the replay window.
+    """
+    response = Response(
+        _event_stream(_last_event_id()), mimetype="text/event-stream"
+    )
     response.headers["Access-Control-Allow-Origin"] = "*"
     return response
 
 
-def _measure_thread(air_sensor, water_sensor, humidity_sensor=None):
+@app.route("/stream/binary")
+def binary_stream_endpoint():
+    """Compact binary alternative to /stream, see utils/binary_stream.py for the format.
+
+    The film details are only sent when they change, and a sample takes about 25 bytes.
+    """
+    response = Response(
+        _binary_stream(_last_event_id()), mimetype="application/octet-stream"
+    )
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _measure_thread(air_sensor, water_sensor, humidity_sensor=None, publish=None):
+    if publish is None:
+        publish = subscribers.broadcast
+
     temperature_sensors = {
         "air": air_sensor,
         "water": water_sensor,
@@ -148,10 +525,10 @@ def _measure_thread(air_sensor, water_sensor, humidity_sensor=None):
     # Measurements log file
     log_dir = pathlib.Path(MEASURE_LOG_DIR)
     log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = (
-        log_dir
-        / f"temperature_{datetime.now(timezone.utc).strftime('%Y-%m-%d_%H%M%S')}.csv"
-    )
+    session_catalog.backfill()
+    start_time = datetime.now(timezone.utc)
+    log_file = log_dir / f"temperature_{start_time.strftime('%Y-%m-%d_%H%M%S')}.csv"
+    session_id = session_catalog.start_session(log_file, start_time)
 
     with open(
         log_file,
@@ -159,9 +536,19 @@ def _measure_thread(air_sensor, water_sensor, humidity_sensor=None):
         newline="",
         encoding="utf-8",
     ) as f:
-        fieldnames = [
-            "time",
-        ] + sorted(list(temperature_sensors.keys()))
+        # Filtered channels also log their raw readings
+        filtered_names = sorted(
+            name
+            for name, handler in temperature_sensors.items()
+            if getattr(handler, "is_filtered", False)
+        )
+        fieldnames = (
+            [
+                "time",
+            ]
+            + sorted(list(temperature_sensors.keys()))
+            + [f"{name}_raw" for name in filtered_names]
+        )
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
 
@@ -171,27 +558,38 @@ def _measure_thread(air_sensor, water_sensor, humidity_sensor=None):
                 measurements = {
                     name: handler() for name, handler in temperature_sensors.items()
                 }
+                raw_measurements = {
+                    name: temperature_sensors[name].last_raw for name in filtered_names
+                }
+                sampling_policy.update(measurements)
                 humidity_measurement = humidity_sensor() if humidity_sensor else None
                 payload = {
-                    "temperatures": [
-                        {"id": name, "temperature": value}
-                        for name, value in measurements.items()
-                    ],
+                    "time": measurement_time.isoformat(),
+                    "temperatures": [],
                 }
+                for name, value in measurements.items():
+                    temperature = {"id": name, "temperature": value}
+                    if name in raw_measurements:
+                        temperature["raw"] = raw_measurements[name]
+                    payload["temperatures"].append(temperature)
                 if humidity_measurement is not None:
                     payload["humidity"] = {
                         "id": "air",
                         "humidity": humidity_measurement,
                     }
+                    if getattr(humidity_sensor, "is_filtered", False):
+                        payload["humidity"]["raw"] = humidity_sensor.last_raw
 
                 water_temp = measurements.get("water")
                 details = film_details.get()
                 if water_temp is not None and details:
                     error = None
                     try:
-                        duration_seconds = details.development_time(
-                            water_temp
-                        ).total_seconds()
+                        duration_seconds = (
+                            _development_film(details)
+                            .development_time(water_temp)
+                            .total_seconds()
+                        )
                     except development.UserError as e:
                         log.info("Unable to calculate development time: %s", e)
                         duration_seconds = -1
@@ -208,37 +606,277 @@ def _measure_thread(air_sensor, water_sensor, humidity_sensor=None):
                             "dx_number": details.dx_number,
                         },
                     }
+                    developer, dilution = developer_selection.get()
+                    if developer != charts.DEFAULT_DEVELOPER:
+                        payload["development"]["film"]["developer"] = developer
+                        payload["development"]["film"]["dilution"] = dilution
                     if error:
                         payload["development"]["error"] = error
 
                 # Show in the UI
-                subscribers.broadcast(payload)
+                publish(payload)
+                startup_profile.mark("first sample")
 
                 # Log to CSV
                 csv_payload = {
                     "time": measurement_time,
                     **measurements,
+                    **{f"{name}_raw": v for name, v in raw_measurements.items()},
                 }
                 writer.writerow(csv_payload)
                 f.flush()
 
+                # Update the session summary
+                session_catalog.add_sample(
+                    session_id,
+                    measurement_time,
+                    measurements,
+                    payload.get("development", {}).get("film"),
+                )
+                session_catalog.save()
+
                 # Report to Home Assistant
                 if ha_device_service:
                     ha_device_service.report_measures(
-                        measurements["air"],
-                        measurements["water"],
-                        humidity_measurement,
+                        {
+                            **measurements,
+                            "humidity": humidity_measurement,
+                            "air_temperature": measurements["air"],
+                            "water_temperature": measurements["water"],
+                            "air_humidity": humidity_measurement,
+                        }
                     )
                 if ha_temperature_service:
-                    ha_temperature_service.report_temperature(
-                        temperature_sensors["air"]()
-                    )
+                    ha_temperature_service.report_temperature(measurements["air"])
                 if ha_humidity_service and humidity_measurement is not None:
                     ha_humidity_service.report_humidity(humidity_measurement)
             except:
                 log.exception("Unable to read sensors")
 
-            time.sleep(INTERVAL_BETWEEN_MEASUREMENTS_SECONDS)
+            # Fast while clients are connected, slower when nobody is watching
+            sampling_policy.wait(has_subscribers=not subscribers.is_empty())
+
+    session_catalog.save(force=True)
+
+
+def _ring_publisher(ring: SharedRingBuffer):
+    def publish(payload):
+        details = film_details.get()
+        ring.set_status(details.dx_number if details else "")
+        ring.write(json.dumps(payload).encode("utf-8"))
+
+    return publish
+
+
+def _ring_reader_thread(ring: SharedRingBuffer):
+    last_demand = 0.0
+    for sequence, data in ring.follow(is_stopping, RING_POLL_INTERVAL_SECONDS):
+        try:
+            # Keep the sampler at the fast rate while we have clients
+            if (
+                not subscribers.is_empty()
+                and time.monotonic() - last_demand > DEMAND_REFRESH_SECONDS
+            ):
+                last_demand = time.monotonic()
+                _notify_demand()
+
+            # Follow film changes made through other web workers
+            dx_number = ring.status()
+            details = film_details.get()
+            if dx_number and (not details or details.dx_number != dx_number):
+                film_details.set(dev_time_db.for_dx_number(dx_number))
+
+            payload = json.loads(data)
+            film = payload.get("development", {}).get("film")
+            if film:
+                developer_selection.set(
+                    (
+                        film.get("developer", charts.DEFAULT_DEVELOPER),
+                        film.get("dilution", ""),
+                    )
+                )
+
+            # Same numbering in all the web workers, so clients can resume on any of them
+            subscribers.broadcast(payload, sequence)
+            startup_profile.mark("first sample")
+        except:
+            log.exception("Unable to read sample from the shared ring buffer")
+
+
+def _handle_sampler_command(command: Dict[str, str]) -> Optional[str]:
+    if command.get("demand"):
+        sampling_policy.notify_demand()
+        return None
+
+    dx_number = command.get("dx_number")
+    if dx_number:
+        new_film_details = dev_time_db.for_dx_number(dx_number)
+        if new_film_details:
+            film_details.set(new_film_details)
+            _save_last_dx_number(new_film_details.dx_number)
+            sampling_policy.notify_activity()
+            return new_film_details.dx_number
+
+    if "developer" in command:
+        developer = command["developer"]
+        dilution = command.get("dilution", "")
+        developer_selection.set((developer, dilution))
+        config_store.update(developer=developer, dilution=dilution)
+        sampling_policy.notify_activity()
+        return developer
+    return None
+
+
+def _init_sensors():
+    if use_stub_sensors:
+        from sensors import stub
+
+        return stub.init_stub(21.0), stub.init_stub(20.0), stub.init_stub(45.0, 2.0)
+
+    # Imported here: the drivers are slow to load, and not needed by the web workers
+    import board
+    import busio
+
+    from sensors import si7021, ds18b20
+
+    # Create the I2C bus
+    i2c = busio.I2C(board.SCL, board.SDA)
+
+    # Init the sensors: the same Si7021 conversion provides air temperature and humidity
+    air_device = si7021.init_si7021_device(i2c)
+    water_sensor = ds18b20.init_ds18b20()
+    return air_device.temperature, water_sensor, air_device.relative_humidity
+
+
+def _init_filtered_sensors(settings: Settings):
+    air_sensor, water_sensor, humidity_sensor = _init_sensors()
+    handlers = {"air": air_sensor, "water": water_sensor, "humidity": humidity_sensor}
+
+    filtered = []
+    for name, handler in handlers.items():
+        config = settings.filters.get(name, SensorFilter())
+        params = {"size": config.size}
+        if config.kind == "ema":
+            params["alpha"] = config.alpha
+        elif config.kind == "kalman":
+            params["process_variance"] = config.process_variance
+            params["measurement_variance"] = config.measurement_variance
+        noise_filter = filters.create_filter(config.kind, **params)
+        log.info("Filter for %s: %s x%d", name, config.kind, config.oversampling)
+        if name == "water" and config.oversampling > 1 and not use_stub_sensors:
+            log.warning(
+                "Each DS18B20 reading takes about %.2fs: oversampling x%d makes "
+                "the water samples that much slower",
+                DS18B20_READ_SECONDS,
+                config.oversampling,
+            )
+        filtered.append(
+            filters.FilteredSensor(handler, noise_filter, config.oversampling)
+        )
+    return tuple(filtered)
+
+
+def _start_measuring(settings: Settings, publish=None):
+    """Initialize Home Assistant and the sensors, then measure until stopped."""
+    # The measuring side owns the configuration file: watch it for external edits
+    config_store.add_listener(_on_configuration_changed)
+    config_store.start()
+    try:
+        with startup_profile.phase("Home Assistant"):
+            _configure_home_assistant(settings)
+        with startup_profile.phase("sensors"):
+            air_sensor, water_sensor, humidity_sensor = _init_filtered_sensors(
+                settings
+            )
+    except Exception:
+        log.exception("Unable to initialize the sensors")
+        # Stop the web server too, so that the service gets restarted
+        _thread.interrupt_main()
+        raise
+
+    _measure_thread(air_sensor, water_sensor, humidity_sensor, publish=publish)
+
+
+def _run_sampler(settings: Settings, ring: SharedRingBuffer, control_address: str):
+    """Measure and publish the samples to the shared ring buffer."""
+    # Fails if another sampler is running
+    listener = sampler_control.listen(control_address)
+    threading.Thread(
+        target=sampler_control.serve_commands,
+        args=(listener, _handle_sampler_command),
+        daemon=True,
+    ).start()
+
+    _start_measuring(settings, publish=_ring_publisher(ring))
+
+
+def _sample_until_stopped(
+    settings: Settings, ring: SharedRingBuffer, control_address: str
+) -> None:
+    """Run the sampler until it stops on error or the process is interrupted."""
+    sampler = threading.Thread(
+        target=_run_sampler, args=(settings, ring, control_address)
+    )
+    sampler.start()
+    try:
+        # The sampler stops on error, e.g. when another one is running
+        while sampler.is_alive() and not is_stopping.wait(
+            INTERVAL_BETWEEN_MEASUREMENTS_SECONDS
+        ):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        is_stopping.set()
+        sampling_policy.wake()
+        sampler.join()
+        config_store.stop()
+
+
+def _watch_sampler_process(process: multiprocessing.process.BaseProcess) -> None:
+    """Stop the web server when the sampler process exits, so that it gets restarted."""
+    process.join()
+    if not is_stopping.is_set():
+        log.error("The sampler process exited with code %s", process.exitcode)
+        _thread.interrupt_main()
+
+
+def _watch_parent_process(parent_pid: int) -> None:
+    """Stop the sampler process when the web server is gone, e.g. killed."""
+    while not is_stopping.wait(PARENT_CHECK_INTERVAL_SECONDS):
+        if os.getppid() != parent_pid:
+            log.warning("The web server exited, stopping the sampler")
+            is_stopping.set()
+            sampling_policy.wake()
+
+
+def _sampler_process(
+    ring: SharedRingBuffer, control_address: str, stub_sensors: bool, parent_pid: int
+):
+    """Entry point of the sampler when it runs as a child process."""
+    global use_stub_sensors
+    use_stub_sensors = stub_sensors
+    threading.Thread(
+        target=_watch_parent_process, args=(parent_pid,), daemon=True
+    ).start()
+    settings = _init_config_store()
+    _init_development_time_db()
+    film_details.set(
+        dev_time_db.for_dx_number(_get_last_dx_number(settings, DEFAULT_DX_NUMBER))
+    )
+    developer_selection.set((settings.developer, settings.dilution))
+    # Inherited from the web server: attaching again would unregister the segment
+    # from the resource tracker they share
+    ring.claim()
+    try:
+        _sample_until_stopped(settings, ring, control_address)
+    finally:
+        ring.close()
+
+
+def _interrupt(signum, frame):
+    # Signal handlers run in the main thread
+    raise KeyboardInterrupt
 
 
 def _parse_arguments() -> argparse.Namespace:
@@ -248,6 +886,35 @@ def _parse_arguments() -> argparse.Namespace:
     parser.add_argument(
         "--port", default="5000", type=int, help="Server port to listen to"
     )
+    parser.add_argument(
+        "--sampler",
+        default="thread",
+        choices=["thread", "process", "standalone", "attach"],
+        help="Where to run the measurements: in a thread of this web server, "
+        "in a child process sharing samples through shared memory, "
+        "standalone without web server, or attach this web server "
+        "to a running standalone sampler",
+    )
+    parser.add_argument(
+        "--ring-name",
+        default=SHARED_RING_NAME,
+        help="Name of the shared memory ring buffer of the sampler",
+    )
+    parser.add_argument(
+        "--control-socket",
+        default=SAMPLER_CONTROL_ADDRESS,
+        help="Unix socket of the sampler, for the film selection",
+    )
+    parser.add_argument(
+        "--stub-sensors",
+        action="store_true",
+        help="Simulate the sensors, e.g. for load tests without hardware",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print the duration of each startup phase, once the first sample is in",
+    )
 
     return parser.parse_args()
 
@@ -262,15 +929,45 @@ def _get_last_dx_number(settings: Settings, default: str) -> str:
     return default
 
 
+def _init_config_store() -> Settings:
+    global config_store
+    config_store = ConfigStore(CONFIGURATION_FILE, _read_configuration)
+    return config_store.get()
+
+
 def _save_last_dx_number(last_dx_number: str) -> None:
-    settings = _read_configuration()
-    settings.dx_number = last_dx_number
-    try:
-        with open(CONFIGURATION_FILE, "w", encoding="utf-8") as f:
-            data = settings.model_dump()
-            json.dump(data, f)
-    except:
-        log.exception("Unable to save last DX number")
+    # Saved to disk in the background
+    config_store.update(dx_number=last_dx_number)
+
+
+def _on_configuration_changed(old: Settings, new: Settings) -> None:
+    """Apply the changes made to config.json while running."""
+    if (
+        old.home_assistant_mqtt_device != new.home_assistant_mqtt_device
+        or old.home_assistant_temperature_service
+        != new.home_assistant_temperature_service
+        or old.home_assistant_humidity_service != new.home_assistant_humidity_service
+    ):
+        log.info("Home Assistant configuration changed, reconnecting")
+        _configure_home_assistant(new)
+
+    details = film_details.get()
+    if new.dx_number and (not details or details.dx_number != new.dx_number):
+        new_film_details = dev_time_db.for_dx_number(new.dx_number)
+        if new_film_details:
+            log.info("Film changed in the configuration: %s", new_film_details)
+            film_details.set(new_film_details)
+            sampling_policy.notify_activity()
+
+    if (old.developer, old.dilution) != (new.developer, new.dilution):
+        log.info(
+            "Developer changed in the configuration: %s %s", new.developer, new.dilution
+        )
+        developer_selection.set((new.developer, new.dilution))
+        sampling_policy.notify_activity()
+
+    if old.filters != new.filters:
+        log.warning("Filter changes are applied on the next restart")
 
 
 def _is_ha_mqtt_config_valid(ha_mqtt_device: HomeAssistantMqttDevice) -> bool:
@@ -298,9 +995,20 @@ def _is_ha_config_valid(ha_service: HomeAssistantService) -> bool:
 
 
 def _configure_home_assistant(settings: Settings):
+    global ha_device_service, ha_temperature_service, ha_humidity_service
+
+    # Replace the services from a previous configuration
+    previous_device_service = ha_device_service
+    ha_device_service = None
+    ha_temperature_service = None
+    ha_humidity_service = None
+    if previous_device_service:
+        previous_device_service.close()
+
     ha_mqtt_settings = settings.home_assistant_mqtt_device
     if _is_ha_mqtt_config_valid(ha_mqtt_settings):
-        global ha_device_service
+        from utils import home_assistant_mqtt_device
+
         ha_device_service = home_assistant_mqtt_device.ThermometerDevice(
             mqtt_hostname=ha_mqtt_settings.mqtt_hostname,
             port=ha_mqtt_settings.port,
@@ -309,11 +1017,16 @@ def _configure_home_assistant(settings: Settings):
             device_name=ha_mqtt_settings.device_name,
             device_id=ha_mqtt_settings.device_id,
         )
+        for sensor in ha_mqtt_settings.sensors:
+            ha_device_service.register_sensor(
+                sensor.key, sensor.name, sensor.device_class, sensor.unit_of_measurement
+            )
         log.info("Home Assistant configuration (MQTT): %s", ha_device_service)
 
     ha_temperature_settings = settings.home_assistant_temperature_service
     if _is_ha_config_valid(ha_temperature_settings):
-        global ha_temperature_service
+        from utils import home_assistant_http_sensor
+
         ha_temperature_service = home_assistant_http_sensor.HomeAssistantHttpSensor(
             entity_id=ha_temperature_settings.entity_id,
             device_name=ha_temperature_settings.device_name,
@@ -325,7 +1038,8 @@ def _configure_home_assistant(settings: Settings):
         )
     ha_humidity_settings = settings.home_assistant_humidity_service
     if _is_ha_config_valid(ha_humidity_settings):
-        global ha_humidity_service
+        from utils import home_assistant_http_sensor
+
         ha_humidity_service = home_assistant_http_sensor.HomeAssistantHttpSensor(
             entity_id=ha_humidity_settings.entity_id,
             device_name=ha_humidity_settings.device_name,
@@ -336,45 +1050,117 @@ def _configure_home_assistant(settings: Settings):
 
 
 def _init_development_time_db():
-    global dev_time_db
+    global dev_time_db, chart_store
     dev_time_db = development.DevelopmentTime("./films.csv", "./chart_letters.csv")
+    # Read on first use
+    chart_store = charts.ChartStore(
+        "./developer_charts.csv", ["./chart_letters.csv", "./developer_curves.csv"]
+    )
+
+
+def _report_startup_profile():
+    if not startup_profile.wait_for("first sample", STARTUP_PROFILE_TIMEOUT_SECONDS):
+        log.warning("No sample after %ss", STARTUP_PROFILE_TIMEOUT_SECONDS)
+    print(startup_profile.report(), flush=True)
 
 
 def main():
     """Main entry point."""
+    main_start = time.perf_counter()
     args = _parse_arguments()
     level = logging.DEBUG if args.verbose else logging.INFO
     logging.basicConfig(level=level)
-
-    # Configure Home Assistant
-    settings = _read_configuration()
-    _configure_home_assistant(settings)
+    startup_profile.enabled = args.profile_startup
+    # Stopped by systemd: shut down like on Ctrl+C, so the pending changes are saved.
+    # Inherited by the sampler process.
+    signal.signal(signal.SIGTERM, _interrupt)
+    global use_stub_sensors
+    use_stub_sensors = args.stub_sensors
+    if args.profile_startup:
+        # Interpreter startup and imports happen before this
+        startup_profile.mark("main() entered", at=main_start)
+        threading.Thread(target=_report_startup_profile, daemon=True).start()
+
+    with startup_profile.phase("configuration"):
+        settings = _init_config_store()
 
     # Load film databases
-    _init_development_time_db()
+    with startup_profile.phase("film database"):
+        _init_development_time_db()
     last_dx_number = _get_last_dx_number(settings, DEFAULT_DX_NUMBER)
     log.info("Initial DX number: %s", last_dx_number)
     film_details.set(dev_time_db.for_dx_number(last_dx_number))
-
-    # Create the I2C bus
-    i2c = busio.I2C(board.SCL, board.SDA)
-
-    # Init the sensors
-    air_sensor = si7021.init_si7021(i2c)
-    water_sensor = ds18b20.init_ds18b20()
-    humidity_sensor = si7021.init_si7021_humidity(i2c)
-
-    # Start measuring thread
-    threading.Thread(
-        target=_measure_thread,
-        args=(air_sensor, water_sensor, humidity_sensor),
-        daemon=False,
-    ).start()
+    developer_selection.set((settings.developer, settings.dilution))
+
+    if args.sampler == "thread":
+        # Start measuring thread. Home Assistant and the sensors are initialized
+        # there, so that the web server is reachable as soon as possible.
+        threading.Thread(
+            target=_start_measuring,
+            args=(settings,),
+            daemon=False,
+        ).start()
+    elif args.sampler == "standalone":
+        ring = SharedRingBuffer(args.ring_name, create=True)
+        try:
+            _sample_until_stopped(settings, ring, args.control_socket)
+        finally:
+            ring.close()
+            ring.unlink()
+        return
+    else:
+        global sampler_control_address
+        sampler_control_address = args.control_socket
+        if args.sampler == "process":
+            ring = SharedRingBuffer(args.ring_name, create=True)
+            # Forked, so the child inherits the ring buffer mapping
+            sampler_process = multiprocessing.get_context("fork").Process(
+                target=_sampler_process,
+                args=(
+                    ring,
+                    sampler_control_address,
+                    use_stub_sensors,
+                    os.getpid(),
+                ),
+                daemon=True,
+            )
+            sampler_process.start()
+            threading.Thread(
+                target=_watch_sampler_process, args=(sampler_process,), daemon=True
+            ).start()
+        else:  # attach
+            ring = SharedRingBuffer(args.ring_name)
+
+        threading.Thread(
+            target=_ring_reader_thread, args=(ring,), daemon=True
+        ).start()
 
     # Web server
-    app.run(host="0.0.0.0", port=args.port, threaded=True)
+    try:
+        with startup_profile.phase("HTTP listener"):
+            server = make_server("0.0.0.0", args.port, app, threaded=True)
+        log.info("Listening on port %d", args.port)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        # Stopped before serving, e.g. the sampler process failed to start
+        pass
 
     is_stopping.set()
+    sampling_policy.wake()
+    config_store.stop()
+    if ha_device_service:
+        ha_device_service.close()
+    if args.sampler == "process":
+        sampler_failed = not sampler_process.is_alive()
+        sampler_process.terminate()
+        sampler_process.join(SAMPLER_STOP_TIMEOUT_SECONDS)
+        if sampler_process.is_alive():
+            sampler_process.kill()
+        # Release the samples
+        ring.close()
+        ring.unlink()
+        if sampler_failed:
+            sys.exit(1)
 
 
 if __name__ == "__main__":